@@ -0,0 +1,321 @@
+import json
+import os
+from typing import Any, List
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from dotenv import load_dotenv
+
+load_dotenv(dotenv_path=".env.local")
+
+# "simple" keeps llama_index's JSON vector store, "ann" uses AnnVectorStore
+VECTOR_STORE_BACKEND = os.environ.get("VECTOR_STORE_BACKEND", "simple")
+
+# Number of IVF lists (0 picks about sqrt(number of vectors)) and how many
+# of them are scanned per query: more lists scanned means better recall
+# and slower queries
+ANN_NLIST = int(os.environ.get("ANN_NLIST", "0"))
+ANN_NPROBE = int(os.environ.get("ANN_NPROBE", "8"))
+
+# Below this many vectors every query is an exact scan
+ANN_EXACT_THRESHOLD = int(os.environ.get("ANN_EXACT_THRESHOLD", "5000"))
+
+DEFAULT_PERSIST_FNAME = "default__vector_store.json"
+VECTORS_SUFFIX = ".ann_vectors.npy"
+IDS_SUFFIX = ".ann_ids.json"
+IVF_SUFFIX = ".ann_ivf.npz"
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _kmeans(sample, nlist, iterations=15, seed=0):
+    """Spherical k-means: centroids of unit vectors, assigned by highest dot product"""
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        for cluster in range(nlist):
+            members = sample[assignment == cluster]
+            if len(members):
+                centroids[cluster] = members.mean(axis=0)
+            else:
+                centroids[cluster] = sample[rng.integers(len(sample))]
+        centroids = _normalize_rows(centroids)
+    return centroids.astype(np.float32)
+
+
+def _base_path(persist_path):
+    root, ext = os.path.splitext(persist_path)
+    return root if ext == ".json" else persist_path
+
+
+def _replace_file(path, write):
+    tmp_path = f"{path}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+class AnnVectorStore(BasePydanticVectorStore):
+    """
+    Approximate nearest neighbour vector store over a memory-mapped float32 matrix.
+
+    Vectors are kept unit-normalized in a .npy file that is memory-mapped on
+    load, so the process only pages in the rows a query touches. An IVF
+    index (k-means centroids plus row lists stored contiguously per
+    centroid) limits each query to the nprobe closest lists. Vectors added
+    since the last persist, and searches restricted to a set of node ids,
+    are scanned exactly.
+    """
+
+    stores_text: bool = False
+    is_embedding_query: bool = True
+    nlist: int = ANN_NLIST
+    nprobe: int = ANN_NPROBE
+    exact_threshold: int = ANN_EXACT_THRESHOLD
+
+    _ids: List[str] = PrivateAttr(default_factory=list)
+    _ref_doc_ids: List[str] = PrivateAttr(default_factory=list)
+    _positions: dict = PrivateAttr(default_factory=dict)
+    _ref_positions: dict = PrivateAttr(default_factory=dict)
+    _matrix: Any = PrivateAttr(default=None)
+    _pending: List[Any] = PrivateAttr(default_factory=list)
+    _deleted: set = PrivateAttr(default_factory=set)
+    _centroids: Any = PrivateAttr(default=None)
+    _order: Any = PrivateAttr(default=None)
+    _offsets: Any = PrivateAttr(default=None)
+
+    @classmethod
+    def class_name(cls):
+        return "AnnVectorStore"
+
+    @property
+    def client(self):
+        return None
+
+    def _vectors(self, positions):
+        """Return the rows at the given positions, from the matrix or the pending vectors"""
+        base = 0 if self._matrix is None else len(self._matrix)
+        positions = np.asarray(positions, dtype=np.int64)
+        in_matrix = positions < base
+        rows = np.empty((len(positions), self._dimension()), dtype=np.float32)
+        if in_matrix.any():
+            # Sorted reads keep memory-mapped access sequential
+            matrix_positions = positions[in_matrix]
+            order = np.argsort(matrix_positions)
+            sorted_rows = np.asarray(self._matrix[matrix_positions[order]])
+            matrix_rows = np.empty_like(sorted_rows)
+            matrix_rows[order] = sorted_rows
+            rows[in_matrix] = matrix_rows
+        if (~in_matrix).any():
+            rows[~in_matrix] = np.stack([self._pending[p - base] for p in positions[~in_matrix]])
+        return rows
+
+    def _dimension(self):
+        if self._matrix is not None:
+            return self._matrix.shape[1]
+        return len(self._pending[0])
+
+    def add(self, nodes, **add_kwargs):
+        ids = []
+        for node in nodes:
+            vector = np.asarray(node.get_embedding(), dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            if norm:
+                vector = vector / norm
+
+            if node.node_id in self._positions:
+                self._deleted.add(self._positions[node.node_id])
+
+            self._positions[node.node_id] = len(self._ids)
+            self._ref_positions.setdefault(node.ref_doc_id or "", []).append(len(self._ids))
+            self._ids.append(node.node_id)
+            self._ref_doc_ids.append(node.ref_doc_id or "")
+            self._pending.append(vector)
+            ids.append(node.node_id)
+        return ids
+
+    def delete(self, ref_doc_id, **delete_kwargs):
+        for position in self._ref_positions.pop(ref_doc_id, []):
+            if self._positions.get(self._ids[position]) == position:
+                self._positions.pop(self._ids[position])
+            self._deleted.add(position)
+
+    def delete_nodes(self, node_ids=None, filters=None, **delete_kwargs):
+        for node_id in node_ids or []:
+            position = self._positions.pop(node_id, None)
+            if position is not None:
+                self._deleted.add(position)
+
+    def clear(self):
+        self._ids, self._ref_doc_ids, self._positions, self._ref_positions = [], [], {}, {}
+        self._matrix, self._pending, self._deleted = None, [], set()
+        self._centroids = self._order = self._offsets = None
+
+    def _index_ids(self):
+        self._positions = {node_id: p for p, node_id in enumerate(self._ids)}
+        self._ref_positions = {}
+        for p, ref_doc_id in enumerate(self._ref_doc_ids):
+            self._ref_positions.setdefault(ref_doc_id, []).append(p)
+
+    def _candidates(self, query_vector, node_ids):
+        """Return the positions to score exactly for a query"""
+        if node_ids is not None:
+            return [self._positions[node_id] for node_id in node_ids if node_id in self._positions]
+
+        base = 0 if self._matrix is None else len(self._matrix)
+        pending = range(base, len(self._ids))
+        if self._centroids is None or base < self.exact_threshold:
+            return list(range(base)) + list(pending)
+
+        nprobe = min(self.nprobe, len(self._centroids))
+        closest = np.argpartition(-(self._centroids @ query_vector), nprobe - 1)[:nprobe]
+        lists = [self._order[self._offsets[c]:self._offsets[c + 1]] for c in closest]
+        return np.concatenate(lists + [np.arange(base, len(self._ids))]).tolist()
+
+    def query(self, query: VectorStoreQuery, **kwargs) -> VectorStoreQueryResult:
+        if not self._ids or query.query_embedding is None:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+
+        query_vector = np.asarray(query.query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query_vector)
+        if norm:
+            query_vector = query_vector / norm
+
+        positions = [p for p in self._candidates(query_vector, query.node_ids) if p not in self._deleted]
+        if not positions:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+
+        scores = self._vectors(positions) @ query_vector
+        top_k = min(query.similarity_top_k, len(positions))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+
+        return VectorStoreQueryResult(
+            similarities=[float(scores[i]) for i in top],
+            ids=[self._ids[positions[i]] for i in top],
+        )
+
+    def _compact(self):
+        """Fold pending vectors into the matrix and drop deleted rows"""
+        keep = [p for p in range(len(self._ids)) if p not in self._deleted]
+        matrix = self._vectors(keep) if keep else np.zeros((0, 0), dtype=np.float32)
+        self._ids = [self._ids[p] for p in keep]
+        self._ref_doc_ids = [self._ref_doc_ids[p] for p in keep]
+        self._index_ids()
+        self._matrix, self._pending, self._deleted = matrix, [], set()
+
+    def _train(self):
+        """Cluster the matrix and lay out each cluster's rows contiguously"""
+        n = len(self._ids)
+        if n < self.exact_threshold:
+            self._centroids = self._order = self._offsets = None
+            return
+
+        nlist = self.nlist or int(np.sqrt(n))
+        nlist = max(1, min(nlist, n))
+        rng = np.random.default_rng(0)
+        sample_size = min(n, max(nlist * 64, 20000))
+        sample = np.asarray(self._matrix[np.sort(rng.choice(n, size=sample_size, replace=False))])
+        centroids = _kmeans(sample, nlist)
+
+        assignment = np.empty(n, dtype=np.int64)
+        for start in range(0, n, 50000):
+            assignment[start:start + 50000] = np.argmax(self._matrix[start:start + 50000] @ centroids.T, axis=1)
+
+        order = np.argsort(assignment, kind="stable")
+        offsets = np.searchsorted(assignment[order], np.arange(nlist + 1))
+        self._centroids, self._order, self._offsets = centroids, order, offsets
+
+    def persist(self, persist_path, fs=None):
+        base = _base_path(persist_path)
+        directory = os.path.dirname(base)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._compact()
+        self._train()
+
+        def write_vectors(path):
+            with open(path, "wb") as f:
+                np.save(f, self._matrix)
+
+        def write_ivf(path):
+            with open(path, "wb") as f:
+                np.savez(f, centroids=self._centroids, order=self._order, offsets=self._offsets)
+
+        def write_ids(path):
+            with open(path, "w") as f:
+                json.dump({"ids": self._ids, "ref_doc_ids": self._ref_doc_ids}, f)
+
+        # The ids file is written last: its presence marks a complete store
+        _replace_file(f"{base}{VECTORS_SUFFIX}", write_vectors)
+        if self._centroids is not None:
+            _replace_file(f"{base}{IVF_SUFFIX}", write_ivf)
+        elif os.path.exists(f"{base}{IVF_SUFFIX}"):
+            os.remove(f"{base}{IVF_SUFFIX}")
+        _replace_file(f"{base}{IDS_SUFFIX}", write_ids)
+
+    @classmethod
+    def from_persist_path(cls, persist_path, **kwargs):
+        base = _base_path(persist_path)
+        store = cls(**kwargs)
+        with open(f"{base}{IDS_SUFFIX}", "r") as f:
+            data = json.load(f)
+
+        store._ids = data["ids"]
+        store._ref_doc_ids = data["ref_doc_ids"]
+        store._index_ids()
+        store._matrix = np.load(f"{base}{VECTORS_SUFFIX}", mmap_mode="r")
+
+        if os.path.exists(f"{base}{IVF_SUFFIX}"):
+            ivf = np.load(f"{base}{IVF_SUFFIX}")
+            store._centroids, store._order, store._offsets = ivf["centroids"], ivf["order"], ivf["offsets"]
+        return store
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir, **kwargs):
+        return cls.from_persist_path(os.path.join(persist_dir, DEFAULT_PERSIST_FNAME), **kwargs)
+
+    @staticmethod
+    def exists(persist_dir):
+        base = _base_path(os.path.join(persist_dir, DEFAULT_PERSIST_FNAME))
+        return os.path.exists(f"{base}{IDS_SUFFIX}")
+
+
+def create_vector_store(backend=None):
+    """Return a new vector store for the configured backend, or None for llama_index's default"""
+    backend = backend or VECTOR_STORE_BACKEND
+    if backend == "ann":
+        return AnnVectorStore()
+    if backend != "simple":
+        raise ValueError(f"Unknown vector store backend: {backend}")
+    return None
+
+
+def load_vector_store(persist_dir):
+    """
+    Return the vector store persisted in an index directory.
+
+    The backend is detected from the files on disk so queries always match
+    the way the index was built. Returns None for llama_index's default
+    JSON store.
+    """
+    if AnnVectorStore.exists(persist_dir):
+        return AnnVectorStore.from_persist_dir(persist_dir)
+    return None
+
+
+def remove_vector_store_files(persist_dir):
+    """Delete persisted vectors of any backend before building a new index in the directory"""
+    base = _base_path(os.path.join(persist_dir, DEFAULT_PERSIST_FNAME))
+    for path in (f"{base}.json", f"{base}{VECTORS_SUFFIX}", f"{base}{IDS_SUFFIX}", f"{base}{IVF_SUFFIX}"):
+        if os.path.exists(path):
+            os.remove(path)
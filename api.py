@@ -1,14 +1,14 @@
-from flask import Flask, jsonify, request, send_file
-import subprocess
+from flask import Flask, Response, g, jsonify, request, send_file
 from dotenv import load_dotenv
-from fpdf import FPDF
-import json
-import os
-import tempfile
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import date
 import vectorDbHandler
+from jobs import estimate_eta, get_job_registry
+from metrics import get_metrics, render_prometheus
 from tools import create_database_connection
-from sqlalchemy import text
-from openai import OpenAI
+from evaluation import (batch_path, evaluate_now, get_batch_evaluation_registry, get_evaluation_registry, report_path,
+                        submit_batch_evaluation, submit_evaluation)
 
 # Load environment variables
 load_dotenv(dotenv_path=".env.local")
@@ -16,24 +16,138 @@ load_dotenv(dotenv_path=".env.local")
 # Create Flask app
 app = Flask(__name__)
 
-@app.route('/api/rebuild-vector-index', methods=['GET'])
+
+@app.before_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def _record_request(response):
+    """Record how long the request took, labelled by route rather than path so ids don't explode the series"""
+    started = g.pop("request_started", None)
+    if started is not None:
+        get_metrics().observe(
+            "http_request_seconds",
+            time.perf_counter() - started,
+            method=request.method,
+            route=request.url_rule.rule if request.url_rule else "unmatched",
+            status=response.status_code,
+        )
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Latency histograms and counters of the API and agent processes in the Prometheus text format"""
+    return Response(render_prometheus(*get_metrics().collect()), mimetype="text/plain; version=0.0.4")
+
+
+def _rebuild_job(job, full_rebuild=False):
+    """Run an index rebuild, reporting progress on the job"""
+    engine = create_database_connection()
+    if engine is None:
+        raise RuntimeError("Failed to connect to database")
+
+    def progress(records_exported, documents_embedded, records_expected):
+        job.update(
+            records_exported=records_exported,
+            documents_embedded=documents_embedded,
+            records_expected=records_expected,
+            eta_seconds=estimate_eta(job.state["started_at"], records_exported, records_expected),
+        )
+
+    return vectorDbHandler.rebuild(engine, full_rebuild=full_rebuild, progress=progress)
+
+
+@app.route('/api/rebuild-vector-index', methods=['POST'])
 def rebuild_vector_index():
+    """
+    Start rebuilding the vector index in the background and return the job.
 
+    A rebuild requested while another one is queued or running returns the
+    job already in progress. Pass {"full": true} to re-embed every document.
+    """
     try:
-        vectorDbHandler.main()
+        data = request.get_json(silent=True) or {}
+        full_rebuild = bool(data.get("full")) or request.args.get("full") == "true"
+
+        job = get_job_registry().submit(
+            "rebuild-vector-index", _rebuild_job, {"full_rebuild": full_rebuild}, coalesce=True
+        )
 
         return jsonify({
-            "status": "success",
-            "message": "Vector index rebuilt successfully"
-        })
+            "status": "accepted",
+            "message": "Vector index rebuild already in progress" if job["coalesced"] else "Vector index rebuild started",
+            "job_id": job["job_id"],
+            "job": job,
+        }), 202
 
-    except subprocess.CalledProcessError as e:
+    except Exception as e:
         return jsonify({
             "status": "error",
-            "message": "Failed to rebuild vector index",
-            "details": e.stderr
+            "message": f"Unexpected error: {str(e)}"
         }), 500
 
+
+@app.route('/api/rebuild-vector-index/<job_id>', methods=['GET'])
+def rebuild_vector_index_status(job_id):
+    """Report the status and progress of an index rebuild job"""
+    job = get_job_registry().get(job_id)
+    if job is None or job["kind"] != "rebuild-vector-index":
+        return jsonify({
+            "status": "error",
+            "message": f"Job {job_id} not found"
+        }), 404
+
+    return jsonify({"status": "success", "job": job})
+
+
+def _evaluation_request():
+    """Return (call_id, evaluation_prompt) from the request body, or None if a field is missing"""
+    data = request.get_json(silent=True)
+    if not data or 'call_id' not in data or 'evaluation_prompt' not in data:
+        return None
+    return data['call_id'], data['evaluation_prompt']
+
+
+def _missing_fields():
+    return jsonify({
+        "status": "error",
+        "message": "Missing required fields: call_id and evaluation_prompt"
+    }), 400
+
+
+def _failed_evaluation(job):
+    if job["error_type"] == "LookupError":
+        return jsonify({"status": "error", "message": job["error"], "job": job}), 404
+    return jsonify({"status": "error", "message": f"Evaluation failed: {job['error']}", "job": job}), 500
+
+
+def _send_report(job):
+    return send_file(
+        report_path(job["job_id"]),
+        as_attachment=True,
+        download_name=f"evaluation_{job['result']['call_id']}.pdf",
+        mimetype="application/pdf"
+    )
+
+
+@app.route('/api/evaluations', methods=['POST'])
+def submit_evaluation_job():
+    """Queue the evaluation of a call and return its job id right away"""
+    fields = _evaluation_request()
+    if fields is None:
+        return _missing_fields()
+
+    try:
+        job = submit_evaluation(*fields)
+        return jsonify({
+            "status": "accepted",
+            "job_id": job["job_id"],
+            "job": job,
+        }), 202
+
     except Exception as e:
         return jsonify({
             "status": "error",
@@ -41,111 +155,156 @@ def rebuild_vector_index():
         }), 500
 
 
+@app.route('/api/evaluations/<job_id>', methods=['GET'])
+def evaluation_status(job_id):
+    """Report the status of an evaluation job, with the evaluation text once it is done"""
+    job = get_evaluation_registry().get(job_id)
+    if job is None or job["kind"] != "evaluation":
+        return jsonify({
+            "status": "error",
+            "message": f"Job {job_id} not found"
+        }), 404
+
+    return jsonify({"status": "success", "job": job})
+
+
+@app.route('/api/evaluations/<job_id>/pdf', methods=['GET'])
+def evaluation_report(job_id):
+    """Download the PDF report of a finished evaluation job"""
+    job = get_evaluation_registry().get(job_id)
+    if job is None or job["kind"] != "evaluation":
+        return jsonify({
+            "status": "error",
+            "message": f"Job {job_id} not found"
+        }), 404
+    if job["status"] == "failed":
+        return _failed_evaluation(job)
+    if job["status"] != "succeeded":
+        return jsonify({
+            "status": "pending",
+            "message": "Evaluation is not finished yet",
+            "job": job,
+        }), 409
+
+    return _send_report(job)
+
+
+@app.route('/api/evaluations/batch', methods=['POST'])
+def submit_batch_evaluation_job():
+    """
+    Queue the evaluation of many calls as one job.
+
+    The body has an evaluation_prompt and either call_ids, a list of call
+    ids, or start_date and end_date (inclusive, YYYY-MM-DD) to evaluate
+    every call started in that range.
+    """
+    data = request.get_json(silent=True) or {}
+    call_ids = data.get("call_ids")
+    start_date = data.get("start_date")
+    end_date = data.get("end_date") or start_date
+
+    if "evaluation_prompt" not in data or (call_ids is None and start_date is None):
+        return jsonify({
+            "status": "error",
+            "message": "Missing required fields: evaluation_prompt and either call_ids or start_date"
+        }), 400
+    if call_ids is not None and not isinstance(call_ids, list):
+        return jsonify({"status": "error", "message": "call_ids must be a list"}), 400
+    if call_ids is None:
+        try:
+            if date.fromisoformat(start_date) > date.fromisoformat(end_date):
+                raise ValueError("start_date is after end_date")
+        except (TypeError, ValueError) as e:
+            return jsonify({"status": "error", "message": f"Invalid date range: {e}"}), 400
+
+    try:
+        job = submit_batch_evaluation(data["evaluation_prompt"], call_ids, start_date, end_date)
+        return jsonify({
+            "status": "accepted",
+            "job_id": job["job_id"],
+            "job": job,
+        }), 202
+
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "message": f"Unexpected error: {str(e)}"
+        }), 500
+
+
+@app.route('/api/evaluations/batch/<job_id>', methods=['GET'])
+def batch_evaluation_status(job_id):
+    """Report the progress of a batch evaluation job, with per-call statuses once it is done"""
+    job = get_batch_evaluation_registry().get(job_id)
+    if job is None or job["kind"] != "evaluation-batch":
+        return jsonify({
+            "status": "error",
+            "message": f"Job {job_id} not found"
+        }), 404
+
+    return jsonify({"status": "success", "job": job})
+
+
+@app.route('/api/evaluations/batch/<job_id>/zip', methods=['GET'])
+def batch_evaluation_reports(job_id):
+    """Download the ZIP of reports and summary.json of a finished batch evaluation"""
+    job = get_batch_evaluation_registry().get(job_id)
+    if job is None or job["kind"] != "evaluation-batch":
+        return jsonify({
+            "status": "error",
+            "message": f"Job {job_id} not found"
+        }), 404
+    if job["status"] == "failed":
+        return jsonify({"status": "error", "message": f"Evaluation failed: {job['error']}", "job": job}), 500
+    if job["status"] != "succeeded":
+        return jsonify({
+            "status": "pending",
+            "message": "Evaluation is not finished yet",
+            "job": job,
+        }), 409
+
+    return send_file(
+        batch_path(job_id),
+        as_attachment=True,
+        download_name=f"evaluations_{job_id}.zip",
+        mimetype="application/zip"
+    )
+
+
 @app.route('/api/evaluate', methods=['POST'])
 def evaluate_call():
+    """
+    Evaluate a call and return the PDF report in the response.
+
+    The evaluation runs on the same worker pool as /api/evaluations and the
+    report is sent from memory, so nothing is left on disk. Prefer
+    /api/evaluations for many calls.
+    """
+    fields = _evaluation_request()
+    if fields is None:
+        return _missing_fields()
+    call_id, evaluation_prompt = fields
+
     try:
-        # Get request data
-        data = request.json
-        if not data or 'call_id' not in data or 'evaluation_prompt' not in data:
-            return jsonify({
-                "status": "error",
-                "message": "Missing required fields: call_id and evaluation_prompt"
-            }), 400
-
-        call_id = data['call_id']
-        evaluation_prompt = data['evaluation_prompt']
-
-        # Connect to database
-        engine = create_database_connection()
-        if engine is None:
-            return jsonify({
-                "status": "error",
-                "message": "Failed to connect to database"
-            }), 500
-
-        # Get transcript file path
-        with engine.connect() as connection:
-            query = text("SELECT Grabacion FROM Calls WHERE Id = :call_id")
-            result = connection.execute(query, {"call_id": call_id}).fetchone()
-
-        if not result:
-            return jsonify({
-                "status": "error",
-                "message": f"Call with ID {call_id} not found"
-            }), 404
-
-        transcript_path = result[0]
-
-        # Load transcript content
-        with open(transcript_path, 'r') as f:
-            transcript_data = json.load(f)
-
-        # Format conversation for evaluation
-        conversation = []
-        for item in transcript_data.get("items", []):
-            if "content" in item and item["content"]:
-                role = "Assistant" if item["role"] == "assistant" else "User"
-                content = item["content"][0] if item["content"] else ""
-                conversation.append(f"{role}: {content}")
-
-        conversation_text = "\n".join(conversation)
-
-        # Call OpenAI for evaluation
-        client = OpenAI()
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system",
-                 "content": "You are an expert call evaluator. Analyze the conversation and provide detailed feedback."},
-                {"role": "user",
-                 "content": f"Evaluation instructions: {evaluation_prompt}\n\nConversation transcript:\n{conversation_text}"}
-            ]
-        )
+        evaluation_result, pdf, cached = evaluate_now(call_id, evaluation_prompt)
 
-        evaluation_result = response.choices[0].message.content
-
-        # Generate PDF
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_font("Arial", size=12)
-
-        # Add title
-        pdf.set_font("Arial", 'B', 16)
-        pdf.cell(200, 10, txt="Reporte de Evaluacion de Llamadas", ln=True, align='C')
-        pdf.ln(10)
-
-        # Add evaluation details
-        pdf.set_font("Arial", 'B', 12)
-        pdf.cell(200, 10, txt=f"Id de Llamada: {call_id}", ln=True)
-        pdf.cell(200, 10, txt="Criterios de Evaluacion:", ln=True)
-        pdf.set_font("Arial", size=12)
-        pdf.multi_cell(190, 10, txt=evaluation_prompt)
-        pdf.ln(10)
-
-        # Add evaluation results
-        pdf.set_font("Arial", 'B', 12)
-        pdf.cell(200, 10, txt="Evaluation Results:", ln=True)
-        pdf.set_font("Arial", size=12)
-
-        # Split by paragraphs and add to PDF
-        for paragraph in evaluation_result.split("\n\n"):
-            pdf.multi_cell(190, 10, txt=paragraph)
-            pdf.ln(5)
-
-        # Save PDF to temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp:
-            pdf_path = tmp.name
-
-        pdf.output(pdf_path)
-
-        # Send PDF file
-        return send_file(
-            pdf_path,
-            as_attachment=True,
-            download_name=f"evaluation_{call_id}.pdf",
-            mimetype="application/pdf"
+        return Response(
+            pdf,
+            mimetype="application/pdf",
+            headers={
+                "Content-Disposition": f'attachment; filename="evaluation_{call_id}.pdf"',
+                "Content-Length": str(len(pdf)),
+                "X-Evaluation-Cached": "true" if cached else "false",
+            },
         )
 
+    except LookupError as e:
+        return jsonify({"status": "error", "message": str(e)}), 404
+    except (TimeoutError, FutureTimeoutError):
+        return jsonify({
+            "status": "error",
+            "message": "Evaluation is taking too long, use /api/evaluations for long calls"
+        }), 504
     except Exception as e:
         return jsonify({
             "status": "error",
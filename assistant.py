@@ -1,38 +1,144 @@
-import json
+import asyncio
+import functools
 from livekit.agents import (
     Agent,
     AgentSession,
     AutoSubscribe,
     JobContext,
+    JobProcess,
     WorkerOptions,
     cli,
 )
 from livekit.plugins import groq, silero, elevenlabs, openai
-import json
 from dotenv import load_dotenv
-from tools import  query_info, save_transcript_database
+from tools import create_search_memo, query_info, save_transcript_database
+from callRecords import get_call_record_writer
+from clientLookup import get_client_lookup
+from metrics import CallLatency, get_metrics
+from providerRouting import RoutedLLM, RoutedSTT, RoutedTTS, routed
+from vectorIndex import get_index_holder
+import transcriptStore
 from datetime import datetime
-import re
+import os
+import time
 
 load_dotenv(dotenv_path=".env.local")
 
+# Job processes kept prewarmed and waiting for calls, and how long prewarming
+# may take before the process is considered broken
+AGENT_IDLE_PROCESSES = int(os.environ.get("AGENT_IDLE_PROCESSES", "3"))
+AGENT_PREWARM_TIMEOUT_SECONDS = float(os.environ.get("AGENT_PREWARM_TIMEOUT_SECONDS", "60"))
+
+# Providers each stage can use, by the names used in <STAGE>_PROVIDERS
+STT_PROVIDERS = {
+    "groq": lambda: groq.STT(model="whisper-large-v3-turbo", language="es"),
+    "openai": lambda: openai.STT(language="es"),
+}
+LLM_PROVIDERS = {
+    "openai": lambda: openai.LLM(model="gpt-4o", tool_choice="auto"),
+    "groq": lambda: groq.LLM(model="llama-3.3-70b-versatile", tool_choice="auto"),
+}
+TTS_PROVIDERS = {
+    "elevenlabs": lambda: elevenlabs.TTS(voice_id="VmejBeYhbrcTPwDniox7", language="es"),
+    "openai": lambda: openai.TTS(),
+}
+
+
+def record_metrics(call_latency, agent_metrics):
+    """
+    Record the LiveKit metrics of one STT, LLM, TTS or end-of-turn event.
+
+    Stage timings go into the process histograms and into the call's own
+    latency summary, grouped by the reply they belong to.
+    """
+    metrics = get_metrics()
+    stages = {
+        "stt_metrics": (("stt", "duration"),),
+        "eou_metrics": (("end_of_utterance", "end_of_utterance_delay"), ("transcription", "transcription_delay")),
+        "llm_metrics": (("llm_ttft", "ttft"), ("llm", "duration")),
+        "tts_metrics": (("tts_ttfb", "ttfb"), ("tts", "duration")),
+    }.get(agent_metrics.type, ())
+    turn_id = getattr(agent_metrics, "speech_id", None)
+
+    for stage, field in stages:
+        seconds = getattr(agent_metrics, field, None)
+        # LiveKit reports -1 for a time to first token or byte that never came
+        if seconds is None or seconds < 0:
+            continue
+        metrics.observe("agent_stage_seconds", seconds, stage=stage)
+        call_latency.add(stage, seconds, turn_id)
+
+    usage = {
+        "llm_metrics": (("llm_prompt_tokens", "prompt_tokens"), ("llm_completion_tokens", "completion_tokens")),
+        "tts_metrics": (("tts_characters", "characters_count"),),
+        "stt_metrics": (("stt_audio_seconds", "audio_duration"),),
+    }.get(agent_metrics.type, ())
+    for name, field in usage:
+        value = getattr(agent_metrics, field, 0) or 0
+        metrics.increment(f"agent_{name}_total", value)
+        call_latency.count(name, value)
+
+
+def prewarm(proc: JobProcess):
+    """
+    Load everything a call needs once per job process, before any call is assigned to it.
+
+    The VAD model and the STT, LLM and TTS clients are kept in
+    proc.userdata and shared by every call the process handles, and the
+    vector index, its embedding model and the client lookup are loaded into
+    their process-wide holders so the first query_info call doesn't wait on
+    them.
+    """
+    started = time.perf_counter()
+
+    proc.userdata["vad"] = silero.VAD.load()
+
+    # Each stage uses the providers listed in STT_PROVIDERS, LLM_PROVIDERS
+    # and TTS_PROVIDERS; with more than one, requests are hedged and fail
+    # over between them
+    proc.userdata["stt"] = routed("stt", STT_PROVIDERS, "groq", 1.5, RoutedSTT)
+    proc.userdata["llm"] = routed("llm", LLM_PROVIDERS, "openai", 2.0, RoutedLLM)
+    proc.userdata["tts"] = routed("tts", TTS_PROVIDERS, "elevenlabs", 1.0, RoutedTTS)
+
+    # A missing or unreadable index must not keep the process from taking
+    # calls; query_info loads it on first use and reports the error then
+    for name, warm in (("vector index", get_index_holder().get_index),
+                       ("client lookup", get_client_lookup().get_index)):
+        try:
+            warm()
+        except Exception as e:
+            print(f"Error prewarming {name}: {e}")
+
+    print(f"Job process prewarmed in {time.perf_counter() - started:.2f}s")
+
+
 async def entrypoint(ctx: JobContext):
     await ctx.connect(auto_subscribe=AutoSubscribe.AUDIO_ONLY)
+    call_started_at = datetime.now()
 
-    async def write_transcript():
-        current_date = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    # Start the call record writer now, so records spooled by earlier calls
+    # are written while this one is in progress
+    get_call_record_writer()
 
-        # Use current directory instead of /tmp
-        filename = f"transcript_{current_date}.json"
+    async def write_transcript():
+        call_ended_at = datetime.now()
+        loop = asyncio.get_running_loop()
 
+        # Compressing and writing the transcript happens off the event loop
         history_dict = session.history.to_dict()
-        with open(filename, "w") as f:
-            json.dump(history_dict, f, indent=2)
-
-        save_transcript_database(
+        history_dict["latency"] = call_latency.summary()
+        get_metrics().increment("agent_calls_total")
+        filename = await loop.run_in_executor(None, functools.partial(
+            transcriptStore.write_transcript, history_dict, ctx.room.name, call_ended_at
+        ))
+
+        await loop.run_in_executor(None, functools.partial(
+            save_transcript_database,
             filepath=filename,
-            room_name=ctx.room.name
-        )
+            room_name=ctx.room.name,
+            started_at=call_started_at,
+            ended_at=call_ended_at,
+        ))
         print(f"Transcript saved to {filename}")
 
     ctx.add_shutdown_callback(write_transcript)
@@ -118,18 +224,23 @@ async def entrypoint(ctx: JobContext):
     )
 
     session = AgentSession(
-        vad=silero.VAD.load(),
-        stt=groq.STT(model="whisper-large-v3-turbo",language="es"),
-        llm=openai.LLM(
-            model="gpt-4o",
-            tool_choice="auto"
-        ),
-        tts=elevenlabs.TTS(
-            voice_id="VmejBeYhbrcTPwDniox7",
-            language="es",
-        )
+        vad=ctx.proc.userdata["vad"],
+        stt=ctx.proc.userdata["stt"],
+        llm=ctx.proc.userdata["llm"],
+        tts=ctx.proc.userdata["tts"],
+        userdata=create_search_memo(),
     )
 
+    # Look the caller up from what they say while the LLM is still deciding
+    # to call query_info, which then answers from the finished lookup
+    @session.on("user_input_transcribed")
+    def speculate(event):
+        session.userdata.speculate(event.transcript)
+
+    # Per-stage timings of this call, saved with its transcript
+    call_latency = CallLatency()
+    session.on("metrics_collected", lambda event: record_metrics(call_latency, event.metrics))
+
     await session.start(agent=agent, room=ctx.room)
     await session.say("Hola, Soy un Agente de IA de SmartVoz. ¿Cuál es su nombre y el nombre de la empresa con la que necesita ayuda?")
     await session.generate_reply(
@@ -139,7 +250,12 @@ async def entrypoint(ctx: JobContext):
 
 def start_assistant():
     """Start the LiveKit agent"""
-    cli.run_app(WorkerOptions(entrypoint_fnc=entrypoint))
+    cli.run_app(WorkerOptions(
+        entrypoint_fnc=entrypoint,
+        prewarm_fnc=prewarm,
+        num_idle_processes=AGENT_IDLE_PROCESSES,
+        initialize_process_timeout=AGENT_PREWARM_TIMEOUT_SECONDS,
+    ))
 
 if __name__ == "__main__":
     start_assistant()
\ No newline at end of file
@@ -0,0 +1,374 @@
+import argparse
+import glob
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from dotenv import load_dotenv
+
+import clientLookup
+import vectorIndex
+from clientLookup import ClientLookup, load_clients, tokenize, trigrams
+from knowledgeBase import KNOWLEDGE_BASE_DIR, read_records, write_shards
+from metrics import get_metrics, percentile
+from transcriptStore import TRANSCRIPTS_DIR, read_transcript
+from vectorDbHandler import build_vector_index, records_to_documents
+from vectorIndex import VectorIndexHolder, search_knowledge_base
+
+load_dotenv(dotenv_path=".env.local")
+
+# Offline benchmark of query_info's retrieval path: no database, network or
+# API key is needed. Documents and queries are embedded with HashEmbedding,
+# so results compare backends and corpus sizes, not embedding models.
+#
+#   python benchmark.py
+#   python benchmark.py --backends simple,ann --clients 0,10000,100000 --output results.jsonl
+
+TOP_K = 5
+
+FIRST_NAMES = (
+    "Ana", "Carlos", "Lucia", "Jorge", "Maria", "Oscar", "Sofia", "Diego", "Valeria", "Luis", "Camila", "Jose",
+    "Daniela", "Miguel", "Gabriela", "Andres", "Paola", "Ricardo", "Fernanda", "Mario", "Nancy", "Raul", "Elena",
+    "Hugo", "Carla", "Pablo", "Veronica", "Sergio", "Patricia", "Marcelo", "Rocio", "Alvaro", "Silvia", "Ivan",
+    "Monica", "Rodrigo", "Natalia", "Gonzalo", "Lorena", "Ernesto",
+)
+LAST_NAMES = (
+    "Aguilar", "Soliz", "Urioste", "Velazquez", "Gutierrez", "Rojas", "Vargas", "Mendoza", "Flores", "Quiroga",
+    "Suarez", "Paz", "Justiniano", "Salvatierra", "Rivero", "Montano", "Herrera", "Castro", "Ortiz", "Romero",
+    "Chavez", "Morales", "Peña", "Cuellar", "Antelo", "Saucedo", "Zambrana", "Camacho", "Arce", "Moreno",
+    "Terrazas", "Banzer", "Claure", "Durán", "Eguez", "Melgar", "Roca", "Sandoval", "Toledo", "Villarroel",
+)
+COMPANY_WORDS = (
+    "Andina", "Oriente", "Sur", "Norte", "Pampa", "Sierra", "Valle", "Lago", "Rio", "Selva", "Chaco", "Illimani",
+)
+COMPANY_KINDS = ("Telecom", "Energia", "Pizzeria", "Seguros", "Banco", "Farmacia", "Transporte", "Agua")
+SERVICES = (
+    ("Pago de Factura", "Permite a los usuarios conocer los metodos de pago para pagar sus facturas"),
+    ("Reclamo de Cobro", "Atiende reclamos por cobros indebidos o duplicados en la cuenta del cliente"),
+    ("Corte de Servicio", "Informa sobre cortes programados y la reconexion del servicio suspendido"),
+    ("Cambio de Plan", "Gestiona el cambio de plan o tarifa contratada por el cliente"),
+    ("Pedido Demorado", "Da seguimiento a pedidos que no llegaron en el tiempo estimado"),
+)
+
+
+@lru_cache(maxsize=200000)
+def _feature_hash(feature):
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class HashEmbedding(BaseEmbedding):
+    """
+    Deterministic local embedding for benchmarks.
+
+    Each token and its character trigrams are hashed into a fixed number of
+    signed dimensions, so texts sharing words or spellings land close
+    together, the same way on every run and machine.
+    """
+
+    dimensions: int = 256
+
+    @classmethod
+    def class_name(cls):
+        return "HashEmbedding"
+
+    def _embed(self, text):
+        vector = [0.0] * self.dimensions
+        for token in tokenize(text):
+            for feature, weight in [(token, 1.0)] + [(gram, 0.5) for gram in trigrams(token)]:
+                h = _feature_hash(feature)
+                vector[h % self.dimensions] += weight if (h >> 32) & 1 else -weight
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def _get_query_embedding(self, query):
+        return self._embed(query)
+
+    async def _aget_query_embedding(self, query):
+        return self._embed(query)
+
+    def _get_text_embedding(self, text):
+        return self._embed(text)
+
+
+def _record(record_id, doc):
+    return {"id": record_id, "text": json.dumps(doc, indent=2, ensure_ascii=False)}
+
+
+def synthetic_records(clients, seed=0):
+    """
+    Yield export records of a synthetic corpus with the given number of clients.
+
+    Companies, services and protocols grow with the number of clients, and
+    records use the same ids and fields as vectorDbHandler's export.
+    """
+    rng = random.Random(seed)
+    enterprises = max(3, clients // 200)
+    names = {}
+    for enterprise_id in range(1, enterprises + 1):
+        word = COMPANY_WORDS[enterprise_id % len(COMPANY_WORDS)]
+        kind = COMPANY_KINDS[enterprise_id % len(COMPANY_KINDS)]
+        name = f"{word} {kind} {enterprise_id}"
+        names[enterprise_id] = name
+        yield _record(f"enterprise_{enterprise_id}.json", {
+            "enterprise_id": f"EM{enterprise_id:05d}", "name": name, "type": "Company",
+            "phoneNumber": str(rng.randint(60000000, 79999999)), "email": f"contacto{enterprise_id}@empresa.bo",
+            "city": "Santa Cruz", "address": f"Calle {rng.randint(1, 300)}",
+        })
+        services = rng.sample(SERVICES, 3)
+        yield _record(f"services_enterprise_{enterprise_id}.json", {
+            "enterprise_id": str(enterprise_id), "enterprise_name": name,
+            "services": [
+                {"service_id": str(enterprise_id * 10 + i), "name": f"{service} {name}", "description": description,
+                 "type": "service"}
+                for i, (service, description) in enumerate(services)
+            ],
+        })
+
+    for client_id in range(1, clients + 1):
+        name = " ".join(rng.sample(FIRST_NAMES, 2) + rng.sample(LAST_NAMES, 2))
+        enterprise_ids = sorted(rng.sample(range(1, enterprises + 1), rng.randint(1, min(3, enterprises))))
+        yield _record(f"client_{client_id}.json", {
+            "client_id": str(client_id), "name": name,
+            "enterprise_id": ", ".join(map(str, enterprise_ids)),
+            "enterprise_name": ", ".join(names[i] for i in enterprise_ids),
+            "type": "client", "carnetIdentidad": str(rng.randint(1000000, 9999999)),
+            "email": f"cliente{client_id}@correo.bo", "phoneNumber": str(rng.randint(60000000, 79999999)),
+            "address": f"Av. {rng.choice(LAST_NAMES)} {rng.randint(1, 999)}",
+        })
+
+    for protocol_id, (service, description) in enumerate(SERVICES, start=1):
+        yield {"id": f"protocol_{protocol_id}.md", "text": (
+            f"# Guia para {service}\n## protocol_id: {protocol_id}\n\n## Description\n{description}\n\n"
+            f"## Steps to Follow\n1. Verificar los datos del cliente\n2. Explicar la solucion\n"
+        )}
+
+
+def _typo(word, rng):
+    if len(word) < 5:
+        return word
+    i = rng.randrange(1, len(word) - 2)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+def labelled_queries(export_dir, limit=500, seed=0):
+    """
+    Return (query, expected record id) pairs for a corpus.
+
+    Clients are asked for by name and company the way callers say them,
+    exactly, in lowercase and with a misheard surname; companies by name;
+    and issues by the description of a service or protocol.
+    """
+    rng = random.Random(seed)
+    queries = []
+
+    clients = load_clients(export_dir)
+    for client in rng.sample(clients, min(len(clients), limit // 4)):
+        if not client["enterprise_names"]:
+            continue
+        record_id = f"client_{client['client_id']}.json"
+        company = rng.choice(client["enterprise_names"])
+        words = client["name"].split()
+        queries.append((f"{client['name']} {company}", record_id))
+        queries.append((f"hola soy {client['name'].lower()} de {company.lower()}", record_id))
+        queries.append((" ".join(words[:-1] + [_typo(words[-1], rng)]) + f" {company}", record_id))
+
+    others = []
+    for record in read_records(export_dir):
+        if record["id"].startswith("enterprise_"):
+            others.append((f"Necesito informacion de la empresa {json.loads(record['text'])['name']}", record["id"]))
+        elif record["id"].startswith("services_enterprise_"):
+            for service in json.loads(record["text"]).get("services", []):
+                others.append((service["description"], record["id"]))
+        elif record["id"].startswith("protocol_"):
+            title = record["text"].splitlines()[0].lstrip("# ")
+            others.append((f"Quiero ayuda con {title}", record["id"]))
+    queries.extend(rng.sample(others, min(len(others), limit - len(queries))))
+    return queries
+
+
+def transcript_utterances(limit=200):
+    """Return what callers said in the recorded transcripts, for latency measurements only"""
+    paths = glob.glob("transcript_*.json") + glob.glob(os.path.join(TRANSCRIPTS_DIR, "**", "*.json*"), recursive=True)
+    utterances = []
+    for path in sorted(paths):
+        try:
+            transcript = read_transcript(path)
+        except (OSError, ValueError):
+            continue
+        for item in transcript.get("items", []):
+            if item.get("role") == "user" and item.get("content"):
+                text = " ".join(str(part) for part in item["content"] if isinstance(part, str)).strip()
+                if text:
+                    utterances.append(text)
+    return utterances[:limit]
+
+
+# Record ids found by the last search of each thread, recorded by the
+# client lookup and retrieve() while search_knowledge_base runs
+_found = threading.local()
+
+
+class RecordingClientLookup(ClientLookup):
+    """Client lookup that records the ids of the clients it finds"""
+
+    def search(self, query, limit=5):
+        matches = super().search(query, limit=limit)
+        _found.ids = [f"client_{client['client_id']}.json" for _, client in matches]
+        return matches
+
+
+@contextmanager
+def recording_retrieve():
+    """Record the ids of the documents vectorIndex.retrieve returns while the block runs"""
+    original = vectorIndex.retrieve
+
+    def retrieve(*args, **kwargs):
+        results = original(*args, **kwargs)
+        _found.ids = [result.node.ref_doc_id for result, _ in results or []]
+        return results
+
+    vectorIndex.retrieve = retrieve
+    try:
+        yield
+    finally:
+        vectorIndex.retrieve = original
+
+
+def run_query(query, top_k=TOP_K):
+    """
+    Run a query through search_knowledge_base in retrieve mode, as query_info does.
+
+    Returns the record ids found, best first: the client lookup's matches
+    when it resolves the query, the vector search results otherwise.
+    """
+    _found.ids = []
+    search_knowledge_base(query, top_k, mode="retrieve")
+    return _found.ids
+
+
+def _peak_memory_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kilobytes on Linux. Each configuration runs in its
+    # own process, so this is the peak of that configuration alone
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _dir_size_mb(path):
+    total = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+    return round(total / 1024 / 1024, 2)
+
+
+def benchmark(export_dir, backend, work_dir, top_k=TOP_K, query_limit=500, threads=4):
+    """Build an index of the corpus with the backend, then measure retrieval latency, throughput and hit@k"""
+    embed_model = HashEmbedding()
+    index_dir = os.path.join(work_dir, f"index_{backend}")
+    shutil.rmtree(index_dir, ignore_errors=True)
+
+    started = time.perf_counter()
+    build_vector_index(index_dir=index_dir, backend=backend, embed_model=embed_model,
+                       documents=records_to_documents(read_records(export_dir)))
+    build_seconds = time.perf_counter() - started
+
+    # Route query_info's retrieval path to this corpus and index
+    clientLookup._lookup = RecordingClientLookup(export_dir=export_dir)
+    vectorIndex._holder = VectorIndexHolder(index_dir=index_dir, embed_model=embed_model)
+    started = time.perf_counter()
+    vectorIndex.get_index_holder().get_index()
+    clientLookup.get_client_lookup().get_index()
+    load_seconds = time.perf_counter() - started
+
+    labelled = labelled_queries(export_dir, limit=query_limit)
+    queries = [query for query, _ in labelled] + transcript_utterances()
+
+    latencies = []
+    hits = {1: 0, top_k: 0}
+    with recording_retrieve():
+        for i, query in enumerate(queries):
+            started = time.perf_counter()
+            found = run_query(query, top_k)
+            latencies.append(time.perf_counter() - started)
+            if i < len(labelled):
+                expected = labelled[i][1]
+                hits[1] += expected in found[:1]
+                hits[top_k] += expected in found[:top_k]
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(lambda query: run_query(query, top_k), queries))
+        concurrent_seconds = time.perf_counter() - started
+
+    return {
+        "backend": backend,
+        "documents": sum(1 for _ in read_records(export_dir)),
+        "queries": len(queries),
+        "labelled_queries": len(labelled),
+        "build_seconds": round(build_seconds, 2),
+        "load_seconds": round(load_seconds, 2),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "throughput_qps": round(len(queries) / concurrent_seconds, 1),
+        "hit@1": round(hits[1] / len(labelled), 3) if labelled else None,
+        f"hit@{top_k}": round(hits[top_k] / len(labelled), 3) if labelled else None,
+        "index_mb": _dir_size_mb(index_dir),
+        "peak_rss_mb": _peak_memory_mb(),
+    }
+
+
+def _benchmark_process(export_dir, backend, work_dir, *args):
+    # Keep benchmark timings out of the metrics served by the API
+    get_metrics().metrics_dir = os.path.join(work_dir, "metrics")
+    return benchmark(export_dir, backend, work_dir, *args)
+
+
+def run_isolated(export_dir, backend, work_dir, *args):
+    """Run benchmark() in a new process, so its peak memory isn't that of earlier runs"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(_benchmark_process, export_dir, backend, work_dir, *args).result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark query_info retrieval offline")
+    parser.add_argument("--backends", default="simple,ann", help="comma-separated vector store backends")
+    parser.add_argument("--clients", default="0",
+                        help="comma-separated synthetic corpus sizes; 0 uses the exported knowledge base")
+    parser.add_argument("--export-dir", default=KNOWLEDGE_BASE_DIR)
+    parser.add_argument("--queries", type=int, default=500, help="maximum number of labelled queries")
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("QUERY_INFO_MAX_WORKERS", "4")))
+    parser.add_argument("--output", help="append results as JSON lines to this file")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="retrieval_benchmark_")
+    try:
+        for clients in [int(n) for n in args.clients.split(",")]:
+            export_dir = args.export_dir
+            if clients:
+                export_dir = os.path.join(work_dir, f"corpus_{clients}")
+                write_shards(synthetic_records(clients), export_dir)
+
+            for backend in args.backends.split(","):
+                result = {"corpus": "export" if not clients else f"synthetic-{clients}",
+                          **run_isolated(export_dir, backend, work_dir, args.top_k, args.queries, args.threads)}
+                print(json.dumps(result))
+                if args.output:
+                    with open(args.output, "a") as f:
+                        f.write(json.dumps(result) + "\n")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from sqlalchemy import text
+from sqlalchemy.exc import InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+from dotenv import load_dotenv
+from database import get_engine
+
+load_dotenv(dotenv_path=".env.local")
+
+# Finished calls are spooled to a local SQLite file first and written to
+# the database in batches by a background thread, so hanging up never waits
+# on MySQL and no call is lost while the database is unavailable
+SPOOL_PATH = os.environ.get("CALL_RECORD_SPOOL_PATH", "./call_records_spool.sqlite3")
+BATCH_SIZE = int(os.environ.get("CALL_RECORD_BATCH_SIZE", "50"))
+FLUSH_SECONDS = float(os.environ.get("CALL_RECORD_FLUSH_SECONDS", "2"))
+MAX_RETRY_SECONDS = float(os.environ.get("CALL_RECORD_MAX_RETRY_SECONDS", "300"))
+
+# Time allowed at process exit to write the records still spooled
+EXIT_FLUSH_SECONDS = float(os.environ.get("CALL_RECORD_EXIT_FLUSH_SECONDS", "2"))
+
+# A record the database keeps rejecting (bad data, constraint violations) is
+# moved to the spool's failed_call_records table after this many attempts,
+# so it doesn't hold back the records spooled after it
+MAX_ATTEMPTS = int(os.environ.get("CALL_RECORD_MAX_ATTEMPTS", "3"))
+
+# Records claimed by a flush that didn't finish are retried after this long
+CLAIM_TIMEOUT_SECONDS = 300
+
+INSERT_CALLS = text("""
+    INSERT INTO Calls (CodigoLlamada, HoraInicio, HoraFin, Grabacion)
+    VALUES (:room_name, :started_at, :ended_at, :filepath)
+""")
+
+
+def format_timestamp(moment):
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _call_key(room_name, started_at):
+    if hasattr(started_at, "strftime"):
+        started_at = format_timestamp(started_at)
+    return str(room_name), str(started_at)
+
+
+def existing_calls(connection, records):
+    """Return the (room name, start time) of the records already in the Calls table, in one query"""
+    pairs = ", ".join(f"(:room_name_{i}, :started_at_{i})" for i in range(len(records)))
+    params = {}
+    for i, record in enumerate(records):
+        params[f"room_name_{i}"] = record["room_name"]
+        params[f"started_at_{i}"] = record["started_at"]
+    rows = connection.execute(
+        text(f"SELECT CodigoLlamada, HoraInicio FROM Calls WHERE (CodigoLlamada, HoraInicio) IN ({pairs})"), params
+    )
+    return {_call_key(room_name, started_at) for room_name, started_at in rows}
+
+
+def insert_call_records(engine, records):
+    """
+    Insert call records into the Calls table in one multi-row statement.
+
+    A call is identified by its room and start time. Records already in
+    Calls are skipped, so a batch written again after its spool rows could
+    not be deleted doesn't duplicate calls.
+    """
+    with engine.begin() as connection:
+        seen = existing_calls(connection, records)
+        new = []
+        for record in records:
+            key = _call_key(record["room_name"], record["started_at"])
+            if key not in seen:
+                seen.add(key)
+                new.append(record)
+        if new:
+            connection.execute(INSERT_CALLS, new)
+
+
+def is_transient(error):
+    """Whether a write failed because of the database rather than the records written"""
+    return isinstance(error, (OperationalError, InterfaceError, PoolTimeoutError, ConnectionError)) or getattr(
+        error, "connection_invalidated", False
+    )
+
+
+class CallRecordWriter:
+    """
+    Durable, batched writer of call records.
+
+    submit() only appends to the local spool. A background thread writes
+    spooled records to the database when BATCH_SIZE of them are waiting or
+    FLUSH_SECONDS have passed, backing off while the database is down. The
+    spool is shared by every process on the machine, so records left by a
+    process that exited are written by the next one.
+
+    When a batch is rejected for anything but a connection problem, its
+    records are written one by one. Each record that fails on its own
+    counts an attempt and is moved to failed_call_records after
+    MAX_ATTEMPTS, where retry_failed() can queue it again.
+    """
+
+    def __init__(self, spool_path=SPOOL_PATH, batch_size=BATCH_SIZE, flush_seconds=FLUSH_SECONDS,
+                 max_attempts=MAX_ATTEMPTS):
+        self.spool_path = spool_path
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pending = 0
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _connection(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.spool_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.spool_path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS call_records (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    record TEXT NOT NULL,
+                    claimed_by TEXT,
+                    claimed_at REAL,
+                    failed_attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT
+                )
+            """)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(call_records)")}
+            if "failed_attempts" not in columns:
+                # Spool created before records were retried one by one
+                self._conn.execute("ALTER TABLE call_records ADD COLUMN failed_attempts INTEGER NOT NULL DEFAULT 0")
+                self._conn.execute("ALTER TABLE call_records ADD COLUMN last_error TEXT")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS failed_call_records (
+                    id INTEGER PRIMARY KEY,
+                    record TEXT NOT NULL,
+                    failed_attempts INTEGER NOT NULL,
+                    last_error TEXT,
+                    failed_at REAL NOT NULL
+                )
+            """)
+            self._conn.commit()
+        return self._conn
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="call-records", daemon=True)
+                self._thread.start()
+        return self
+
+    def submit(self, record):
+        """Spool a call record to be written to the database"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("INSERT INTO call_records (record) VALUES (?)", (json.dumps(record),))
+            conn.commit()
+            self._pending += 1
+            if self._pending >= self.batch_size:
+                self._wake.set()
+
+    def _claim(self):
+        claim = uuid.uuid4().hex
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                """
+                UPDATE call_records SET claimed_by = ?, claimed_at = ?
+                WHERE id IN (
+                    SELECT id FROM call_records
+                    WHERE claimed_by IS NULL OR claimed_at < ?
+                    ORDER BY id LIMIT ?
+                )
+                """,
+                (claim, time.time(), time.time() - CLAIM_TIMEOUT_SECONDS, self.batch_size),
+            )
+            conn.commit()
+            rows = conn.execute("SELECT id, record FROM call_records WHERE claimed_by = ?", (claim,)).fetchall()
+        return claim, rows
+
+    def _delete(self, ids):
+        with self._lock:
+            conn = self._connection()
+            conn.executemany("DELETE FROM call_records WHERE id = ?", [(row_id,) for row_id in ids])
+            conn.commit()
+            self._pending = max(0, self._pending - len(ids))
+
+    def _release(self, claim):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("UPDATE call_records SET claimed_by = NULL WHERE claimed_by = ?", (claim,))
+            conn.commit()
+
+    def _fail(self, row_id, error):
+        """Count a failed attempt at a record, moving it to failed_call_records after max_attempts"""
+        # Keep the driver's message rather than SQLAlchemy's, which repeats the statement
+        error = getattr(error, "orig", None) or error
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                """
+                UPDATE call_records
+                SET failed_attempts = failed_attempts + 1, last_error = ?, claimed_by = NULL
+                WHERE id = ?
+                """,
+                (str(error)[:1000], row_id),
+            )
+            moved = conn.execute(
+                """
+                INSERT INTO failed_call_records (id, record, failed_attempts, last_error, failed_at)
+                SELECT id, record, failed_attempts, last_error, ? FROM call_records
+                WHERE id = ? AND failed_attempts >= ?
+                """,
+                (time.time(), row_id, self.max_attempts),
+            ).rowcount
+            if moved:
+                conn.execute("DELETE FROM call_records WHERE id = ?", (row_id,))
+                self._pending = max(0, self._pending - 1)
+            conn.commit()
+        if moved:
+            print(f"Call record {row_id} moved to failed_call_records after {self.max_attempts} attempts: {error}")
+
+    def retry_failed(self):
+        """Queue the records in failed_call_records again. Returns how many were queued."""
+        with self._lock:
+            conn = self._connection()
+            queued = conn.execute("INSERT INTO call_records (record) SELECT record FROM failed_call_records").rowcount
+            conn.execute("DELETE FROM failed_call_records")
+            conn.commit()
+            self._pending += queued
+        self._wake.set()
+        return queued
+
+    def _write_each(self, claim, rows):
+        """Write the records of a rejected batch one by one. Returns how many were written and failed."""
+        written, failed = 0, 0
+        for row_id, record in rows:
+            try:
+                insert_call_records(get_engine(), [json.loads(record)])
+            except Exception as e:
+                if is_transient(e):
+                    self._release(claim)
+                    raise
+                self._fail(row_id, e)
+                failed += 1
+                continue
+            self._delete([row_id])
+            written += 1
+        return written, failed
+
+    def flush(self):
+        """Write spooled records to the database until the spool is empty. Returns the number written."""
+        written = 0
+        while True:
+            claim, rows = self._claim()
+            if not rows:
+                return written
+
+            try:
+                insert_call_records(get_engine(), [json.loads(record) for _, record in rows])
+            except Exception as e:
+                if is_transient(e):
+                    self._release(claim)
+                    raise
+                print(f"Batch of {len(rows)} call records rejected, writing them one by one: {getattr(e, 'orig', None) or e}")
+                batch_written, failed = self._write_each(claim, rows)
+                written += batch_written
+                if failed:
+                    # Records that failed are tried again on the next flush
+                    return written
+                continue
+
+            self._delete([row_id for row_id, _ in rows])
+            written += len(rows)
+
+    def _run(self):
+        delay = self.flush_seconds
+        while not self._stopped.is_set():
+            if delay > self.flush_seconds:
+                # Backing off after a failure; a full batch doesn't cut the wait short
+                self._stopped.wait(timeout=delay)
+            else:
+                self._wake.wait(timeout=delay)
+            self._wake.clear()
+            try:
+                written = self.flush()
+                if written:
+                    print(f"Saved {written} call records to the database")
+                delay = self.flush_seconds
+            except Exception as e:
+                delay = min(max(delay * 2, 5.0), MAX_RETRY_SECONDS)
+                print(f"Error saving call records to database, retrying in {delay:.0f}s: {e}")
+
+    def close(self, timeout=EXIT_FLUSH_SECONDS):
+        """Stop the background thread, trying a last flush; records not written stay spooled"""
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+        flusher = threading.Thread(target=self._final_flush, daemon=True)
+        flusher.start()
+        flusher.join(timeout)
+
+    def _final_flush(self):
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Call records left in {self.spool_path}: {e}")
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_call_record_writer():
+    """Return the call record writer of this process, started on first use"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = CallRecordWriter().start()
+                atexit.register(_writer.close)
+    return _writer
@@ -0,0 +1,273 @@
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from knowledgeBase import KNOWLEDGE_BASE_DIR, read_records
+
+# How often (in seconds) a lookup checks whether the export on disk has changed
+RELOAD_CHECK_SECONDS = float(os.environ.get("CLIENT_LOOKUP_RELOAD_CHECK_SECONDS", "30"))
+
+# Minimum trigram similarity for a misspelled token to count as a match
+FUZZY_THRESHOLD = 0.6
+
+# Name tokens a client must match, or all of them when the name is shorter,
+# so a shared first name or surname alone never identifies a caller. The
+# matched tokens must also average a similarity of 0.8
+MIN_NAME_TOKENS = 2
+
+# Words callers use around their name and company that should never match
+STOPWORDS = {
+    "a", "al", "buenas", "buenos", "con", "de", "del", "dias", "el", "en", "es", "estoy", "gracias", "hola",
+    "la", "las", "llamo", "los", "me", "mi", "noches", "nombre", "parte", "por", "soy", "su", "tardes", "un",
+    "una", "y",
+}
+
+
+def normalize(text):
+    """Lowercase text and strip accents and punctuation"""
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r"[^0-9a-z]+", " ", text.casefold()).strip()
+
+
+def tokenize(text):
+    """Split text into normalized tokens, dropping filler words"""
+    return [token for token in normalize(text).split() if token not in STOPWORDS]
+
+
+def trigrams(token):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def token_similarity(a, b):
+    """Dice coefficient over character trigrams, 1.0 for identical tokens"""
+    if a == b:
+        return 1.0
+    if len(a) < 3 or len(b) < 3:
+        return 0.0
+    ta, tb = trigrams(a), trigrams(b)
+    return 2 * len(ta & tb) / (len(ta) + len(tb))
+
+
+class ClientLookupIndex:
+    """
+    In-memory index of clients and their companies for exact and fuzzy lookups.
+
+    Names are matched token by token after case and accent folding, and
+    tokens misheard by speech-to-text are matched through a trigram index
+    over the vocabulary of known names.
+    """
+
+    def __init__(self, clients):
+        self.clients = clients
+        self._name_postings = defaultdict(set)
+        self._trigram_postings = defaultdict(set)
+        self._client_tokens = []
+
+        for position, client in enumerate(clients):
+            name_tokens = tokenize(client["name"])
+            enterprise_tokens = [tokenize(name) for name in client["enterprise_names"]]
+            self._client_tokens.append((name_tokens, enterprise_tokens))
+
+            for token in set(name_tokens).union(*enterprise_tokens):
+                if token not in self._name_postings:
+                    for gram in trigrams(token):
+                        self._trigram_postings[gram].add(token)
+                self._name_postings[token].add(position)
+
+    def __len__(self):
+        return len(self.clients)
+
+    def _expand(self, token):
+        """Return the known tokens similar to a query token with their similarity"""
+        if token in self._name_postings:
+            return {token: 1.0}
+        if len(token) < 3:
+            return {}
+
+        candidates = set()
+        for gram in trigrams(token):
+            candidates.update(self._trigram_postings.get(gram, ()))
+
+        matches = {}
+        for candidate in candidates:
+            similarity = token_similarity(token, candidate)
+            if similarity >= FUZZY_THRESHOLD:
+                matches[candidate] = similarity
+        return matches
+
+    def search(self, query, limit=5):
+        """
+        Find clients whose name and associated company both appear in the query.
+
+        Each query token counts towards one name or company token at most,
+        and tokens that matched the company don't count towards the name, so
+        a caller sharing a first name or a company word with a client is not
+        taken for them. Returns a list of (score, client) tuples, best first.
+        An empty list means the query could not be resolved to a registered
+        client.
+        """
+        expanded = {token: self._expand(token) for token in set(tokenize(query))}
+        expanded = {token: matches for token, matches in expanded.items() if matches}
+        if not expanded:
+            return []
+
+        candidates = set()
+        for matches in expanded.values():
+            for known in matches:
+                candidates.update(self._name_postings[known])
+
+        results = []
+        for position in candidates:
+            name_tokens, enterprise_tokens = self._client_tokens[position]
+            if not name_tokens:
+                continue
+
+            company_score, company_used = 0.0, set()
+            for tokens in enterprise_tokens:
+                if tokens:
+                    scores, used = _assign(tokens, expanded, set())
+                    score = sum(scores) / len(tokens)
+                    if score > company_score:
+                        company_score, company_used = score, used
+            if company_score < 0.8:
+                continue
+
+            name_scores, _ = _assign(name_tokens, expanded, company_used)
+            matched = [score for score in name_scores if score]
+            if len(matched) < min(MIN_NAME_TOKENS, len(name_tokens)) or sum(matched) / len(matched) < 0.8:
+                continue
+
+            name_score = sum(name_scores) / len(name_tokens)
+            results.append((name_score + company_score, self.clients[position]))
+
+        results.sort(key=lambda result: result[0], reverse=True)
+        return results[:limit]
+
+
+def _assign(tokens, expanded, excluded):
+    """
+    Match each known token to the most similar query token not used yet.
+
+    Returns the score of each token (0.0 when nothing matched) and the query
+    tokens used, including those in excluded.
+    """
+    used = set(excluded)
+    scores = []
+    for token in tokens:
+        best, best_query = 0.0, None
+        for query_token, matches in expanded.items():
+            if query_token not in used and matches.get(token, 0.0) > best:
+                best, best_query = matches[token], query_token
+        if best_query is not None:
+            used.add(best_query)
+        scores.append(best)
+    return scores, used - excluded
+
+
+def uncovered_tokens(query, matches):
+    """Return the query tokens that are not part of the name or a company of any client found"""
+    known = set()
+    for _, client in matches:
+        known.update(tokenize(client["name"]))
+        for name in client["enterprise_names"]:
+            known.update(tokenize(name))
+    return [
+        token for token in tokenize(query)
+        if not any(token_similarity(token, name_token) >= FUZZY_THRESHOLD for name_token in known)
+    ]
+
+
+def _client_record(doc, enterprise_ids, enterprise_names):
+    record = dict(doc)
+    record["enterprise_names"] = [name.strip() for name in str(enterprise_names or "").split(",") if name.strip()]
+    record.setdefault("enterprise_id", str(enterprise_ids or ""))
+    record.setdefault("enterprise_name", ", ".join(record["enterprise_names"]))
+    return record
+
+
+def load_clients(export_dir=KNOWLEDGE_BASE_DIR):
+    """Read the client records written by vectorDbHandler.export_db_to_files"""
+    clients = []
+    for record in read_records(export_dir):
+        try:
+            if record["id"].startswith("clients_enterprise_"):
+                group = json.loads(record["text"])
+                for client in group.get("clients", []):
+                    clients.append(_client_record(client, group.get("enterprise_ids"), group.get("enterprises_names")))
+            elif record["id"].startswith("client_"):
+                client = json.loads(record["text"])
+                clients.append(_client_record(client, client.get("enterprise_id"), client.get("enterprise_name")))
+        except Exception as e:
+            print(f"Error loading client export {record['id']}: {e}")
+
+    return clients
+
+
+def format_matches(matches):
+    """Format lookup results the same way the agent reads vector search results"""
+    lines = []
+    for score, client in matches:
+        doc = {key: value for key, value in client.items() if key != "enterprise_names"}
+        lines.append(json.dumps(doc, ensure_ascii=False))
+    return "\n".join(lines)
+
+
+def _export_version(export_dir):
+    if not os.path.isdir(export_dir):
+        return None
+    return os.stat(export_dir).st_mtime_ns, tuple(
+        (entry.name, entry.stat().st_mtime_ns)
+        for entry in sorted(os.scandir(export_dir), key=lambda entry: entry.name)
+        if entry.name.startswith(("client", "kb-"))
+    )
+
+
+class ClientLookup:
+    """Process-wide client lookup index, rebuilt when the export on disk changes"""
+
+    def __init__(self, export_dir=KNOWLEDGE_BASE_DIR, check_interval=RELOAD_CHECK_SECONDS):
+        self.export_dir = export_dir
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._index = None
+        self._version = None
+        self._last_check = 0.0
+
+    def get_index(self):
+        """Return the current lookup index, building it on first use"""
+        if self._index is not None and time.monotonic() - self._last_check < self.check_interval:
+            return self._index
+
+        with self._lock:
+            if self._index is not None and time.monotonic() - self._last_check < self.check_interval:
+                return self._index
+
+            version = _export_version(self.export_dir)
+            if self._index is None or version != self._version:
+                self._index = ClientLookupIndex(load_clients(self.export_dir))
+                self._version = version
+                print(f"Client lookup index loaded with {len(self._index)} clients")
+            self._last_check = time.monotonic()
+            return self._index
+
+    def search(self, query, limit=5):
+        return self.get_index().search(query, limit=limit)
+
+
+_lookup = None
+_lookup_lock = threading.Lock()
+
+
+def get_client_lookup():
+    """Return the shared client lookup for this process"""
+    global _lookup
+    if _lookup is None:
+        with _lookup_lock:
+            if _lookup is None:
+                _lookup = ClientLookup()
+    return _lookup
@@ -0,0 +1,77 @@
+import os
+import threading
+from sqlalchemy import create_engine, text
+from dotenv import load_dotenv
+
+load_dotenv(dotenv_path=".env.local")
+
+# Connection pool of the shared engine
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+# MySQL closes idle connections after wait_timeout (8 hours by default);
+# recycling them well before that avoids "server has gone away" errors
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+
+
+def connection_url(host=None, port=None, user=None, password=None, db_name=None):
+    """Return the MySQL connection URL, taking unset parts from the MYSQL_* environment variables"""
+    host = host or os.environ.get("MYSQL_HOST")
+    port = port or os.environ.get("MYSQL_PORT") or "3306"
+    user = user or os.environ.get("MYSQL_USER")
+    password = password or os.environ.get("MYSQL_PASSWORD")
+    db_name = db_name or os.environ.get("MYSQL_DATABASE")
+    return f"mysql+pymysql://{user}:{password}@{host}:{port}/{db_name}"
+
+
+def create_pooled_engine(url=None):
+    """
+    Create an engine with a bounded connection pool.
+
+    Connections are checked with a lightweight ping when taken from the pool,
+    so a connection dropped by the server is replaced instead of failing the
+    query.
+    """
+    return create_engine(
+        url or connection_url(),
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+
+
+def check_connection(engine):
+    """Return True if the database answers a trivial query"""
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        return True
+    except Exception as e:
+        print(f"Error connecting to database: {e}")
+        return False
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Return the engine shared by everything in this process, creating it on first use"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_pooled_engine()
+    return _engine
+
+
+def _reset_after_fork():
+    # Pooled connections must not be shared with a forked child process
+    if _engine is not None:
+        _engine.dispose(close=False)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,247 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from dotenv import load_dotenv
+from metrics import get_metrics
+
+load_dotenv(dotenv_path=".env.local")
+
+CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "./embedding_cache.sqlite3")
+CACHE_MAX_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", "500000"))
+MEMORY_MAX_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MEMORY_ENTRIES", "10000"))
+
+# How long a read or write waits for another process holding the SQLite
+# file before it gives up and is treated as a miss or skipped
+BUSY_TIMEOUT_SECONDS = float(os.environ.get("EMBEDDING_CACHE_BUSY_TIMEOUT_SECONDS", "2"))
+
+
+def cache_key(model_name, kind, text):
+    """Hash of the model, the kind of embedding (query or text) and the whitespace-normalized text"""
+    normalized = re.sub(r"\s+", " ", text).strip()
+    return hashlib.sha256(f"{model_name}\0{kind}\0{normalized}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache: an in-memory LRU in front of a SQLite file.
+
+    The SQLite tier is bounded to max_entries rows; when it grows past the
+    bound the least recently used rows are evicted. It is shared by every
+    process using the same file, and any SQLite error (such as the file
+    staying locked longer than busy_timeout) only makes a read a miss or
+    skips a write, so the cache never fails an embedding.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_entries=CACHE_MAX_ENTRIES, memory_entries=MEMORY_MAX_ENTRIES,
+                 busy_timeout=BUSY_TIMEOUT_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.busy_timeout = busy_timeout
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._writes = 0
+
+    def _connection(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    vector BLOB NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            self._conn = conn
+        return self._conn
+
+    def _failed(self, operation, error):
+        """Log a SQLite error and drop the transaction it left open"""
+        print(f"Embedding cache {operation} skipped: {error}")
+        get_metrics().increment("embedding_cache_errors_total", operation=operation)
+        if self._conn is not None:
+            try:
+                self._conn.rollback()
+            except sqlite3.Error:
+                pass
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys):
+        """Return {key: vector} for the keys found in the cache"""
+        found = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+                else:
+                    missing.append(key)
+
+            if missing:
+                try:
+                    self._read(missing, found)
+                except (sqlite3.Error, OSError) as e:
+                    self._failed("read", e)
+        return found
+
+    def _read(self, keys, found):
+        conn = self._connection()
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+            ).fetchall()
+            for key, blob in rows:
+                vector = array("f", blob).tolist()
+                found[key] = vector
+                self._remember(key, vector)
+
+            hits = [key for key, _ in rows]
+            if hits:
+                conn.execute(
+                    f"UPDATE embeddings SET last_used = ? WHERE key IN ({','.join('?' * len(hits))})",
+                    [time.time(), *hits],
+                )
+        conn.commit()
+
+    def put_many(self, items):
+        """Store {key: vector} in both tiers"""
+        if not items:
+            return
+
+        with self._lock:
+            for key, vector in items.items():
+                self._remember(key, list(vector))
+
+            try:
+                now = time.time()
+                conn = self._connection()
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                    [(key, array("f", vector).tobytes(), now) for key, vector in items.items()],
+                )
+
+                self._writes += len(items)
+                if self._writes >= 1000:
+                    self._writes = 0
+                    self._evict(conn)
+                conn.commit()
+            except (sqlite3.Error, OSError) as e:
+                self._failed("write", e)
+
+    def _evict(self, conn):
+        count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+
+
+class CachedEmbedding(BaseEmbedding):
+    """Embedding model wrapper that serves repeated texts and queries from an EmbeddingCache"""
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, embed_model, cache, **kwargs):
+        super().__init__(
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            **kwargs,
+        )
+        self._embed_model = embed_model
+        self._cache = cache
+
+    @classmethod
+    def class_name(cls):
+        return "CachedEmbedding"
+
+    def _lookup(self, kind, texts):
+        keys = [cache_key(self.model_name, kind, text) for text in texts]
+        found = self._cache.get_many(keys)
+        missing = [i for i, key in enumerate(keys) if key not in found]
+        return keys, found, missing
+
+    def _store(self, keys, found, missing, embeddings):
+        new = {keys[i]: embedding for i, embedding in zip(missing, embeddings)}
+        self._cache.put_many(new)
+        found.update(new)
+        return [found[key] for key in keys]
+
+    def _get_query_embedding(self, query):
+        keys, found, missing = self._lookup("query", [query])
+        if missing:
+            with get_metrics().timer("query_info_stage_seconds", stage="embedding"):
+                embedding = self._embed_model.get_query_embedding(query)
+            get_metrics().increment("query_embedding_cache_total", result="miss")
+            return self._store(keys, found, missing, [embedding])[0]
+        get_metrics().increment("query_embedding_cache_total", result="hit")
+        return found[keys[0]]
+
+    async def _aget_query_embedding(self, query):
+        keys, found, missing = self._lookup("query", [query])
+        if missing:
+            return self._store(keys, found, missing, [await self._embed_model.aget_query_embedding(query)])[0]
+        return found[keys[0]]
+
+    def _get_text_embedding(self, text):
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text):
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts):
+        keys, found, missing = self._lookup("text", texts)
+        embeddings = []
+        if missing:
+            embeddings = self._embed_model.get_text_embedding_batch([texts[i] for i in missing])
+        return self._store(keys, found, missing, embeddings)
+
+    async def _aget_text_embeddings(self, texts):
+        keys, found, missing = self._lookup("text", texts)
+        embeddings = []
+        if missing:
+            embeddings = await self._embed_model.aget_text_embedding_batch([texts[i] for i in missing])
+        return self._store(keys, found, missing, embeddings)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    """Return the shared embedding cache for this process"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache()
+    return _cache
+
+
+def with_cache(embed_model):
+    """Wrap an embedding model so its embeddings are cached on disk"""
+    return CachedEmbedding(embed_model, get_embedding_cache())
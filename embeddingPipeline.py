@@ -0,0 +1,222 @@
+import math
+import os
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import MetadataMode
+from dotenv import load_dotenv
+
+load_dotenv(dotenv_path=".env.local")
+
+# Texts sent to the embedding API per request, and the most requests in flight
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "100"))
+EMBED_MAX_CONCURRENCY = int(os.environ.get("EMBED_MAX_CONCURRENCY", "8"))
+EMBED_MAX_RETRIES = int(os.environ.get("EMBED_MAX_RETRIES", "6"))
+
+# Processes used by the local embedding model, one per CPU core by default
+LOCAL_EMBED_WORKERS = int(os.environ.get("LOCAL_EMBED_WORKERS", "0")) or os.cpu_count() or 1
+
+
+def is_rate_limited(error):
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def retry_after(error):
+    """Seconds the API asked us to wait before retrying, if it said"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveConcurrency:
+    """
+    Limits the embedding requests in flight, adapting to the API's rate limits.
+
+    The limit grows by one after a full round of successful requests and is
+    halved when a request is rate limited, at which point every request
+    also waits out the backoff before being sent.
+    """
+
+    def __init__(self, max_limit=EMBED_MAX_CONCURRENCY, min_limit=1):
+        self.max_limit = max(max_limit, min_limit)
+        self.min_limit = min_limit
+        self.limit = self.max_limit
+        self._active = 0
+        self._successes = 0
+        self._resume_at = 0.0
+        self._condition = threading.Condition()
+
+    def __enter__(self):
+        with self._condition:
+            while True:
+                wait = self._resume_at - time.monotonic()
+                if wait <= 0 and self._active < self.limit:
+                    break
+                self._condition.wait(timeout=wait if wait > 0 else None)
+            self._active += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    def succeeded(self):
+        with self._condition:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.max_limit:
+                self.limit += 1
+                self._successes = 0
+                self._condition.notify_all()
+
+    def rate_limited(self, delay):
+        with self._condition:
+            self.limit = max(self.min_limit, self.limit // 2)
+            self._successes = 0
+            self._resume_at = max(self._resume_at, time.monotonic() + delay)
+        print(f"Embedding rate limited, concurrency reduced to {self.limit}, pausing {delay:.1f}s")
+
+
+def _backoff(attempt):
+    return min(60.0, 2 ** attempt) + random.uniform(0, 1)
+
+
+def embed_nodes(nodes, embed_model, batch_size=None, max_concurrency=EMBED_MAX_CONCURRENCY):
+    """
+    Embed nodes in batches sent concurrently, setting node.embedding in place.
+
+    Nodes that already have an embedding are skipped. Failed batches are
+    retried with exponential backoff; rate-limited ones also lower the
+    concurrency for every batch that follows.
+    """
+    pending = [node for node in nodes if node.embedding is None]
+    if not pending:
+        return nodes
+
+    batch_size = batch_size or embed_model.embed_batch_size
+    batches = [pending[start:start + batch_size] for start in range(0, len(pending), batch_size)]
+    limiter = AdaptiveConcurrency(min(max_concurrency, len(batches)))
+
+    def embed_batch(batch):
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in batch]
+        for attempt in range(EMBED_MAX_RETRIES + 1):
+            with limiter:
+                try:
+                    embeddings = embed_model.get_text_embedding_batch(texts)
+                except Exception as e:
+                    if attempt == EMBED_MAX_RETRIES:
+                        raise
+                    delay = retry_after(e) or _backoff(attempt)
+                    rate_limited = is_rate_limited(e)
+                    if rate_limited:
+                        limiter.rate_limited(delay)
+                    else:
+                        print(f"Embedding batch failed ({e}), retrying in {delay:.1f}s")
+                else:
+                    limiter.succeeded()
+                    break
+
+            # Rate-limited batches wait in the limiter along with every other batch
+            if not rate_limited:
+                time.sleep(delay)
+
+        for node, embedding in zip(batch, embeddings):
+            node.embedding = embedding
+
+    with ThreadPoolExecutor(max_workers=limiter.max_limit, thread_name_prefix="embed") as pool:
+        for future in [pool.submit(embed_batch, batch) for batch in batches]:
+            future.result()
+
+    return nodes
+
+
+_local_model = None
+
+
+def _init_local_worker(model_name):
+    """Load the local model once per worker process, using a single thread so workers don't compete"""
+    global _local_model
+    import torch
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    torch.set_num_threads(1)
+    _local_model = HuggingFaceEmbedding(model_name=model_name)
+
+
+def _local_text_embeddings(texts):
+    return _local_model.get_text_embedding_batch(texts)
+
+
+def _local_query_embedding(query):
+    return _local_model.get_query_embedding(query)
+
+
+class LocalEmbeddingPool(BaseEmbedding):
+    """
+    HuggingFace embedding model run on a pool of processes, one per CPU core.
+
+    Each batch is split evenly across the workers, so a single call keeps
+    every core busy.
+    """
+
+    _workers: int = PrivateAttr()
+    _pool: ProcessPoolExecutor = PrivateAttr(default=None)
+    _pool_lock: threading.Lock = PrivateAttr()
+
+    def __init__(self, model_name, workers=LOCAL_EMBED_WORKERS, **kwargs):
+        super().__init__(model_name=model_name, embed_batch_size=32 * workers, **kwargs)
+        self._workers = workers
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls):
+        return "LocalEmbeddingPool"
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self._workers,
+                    initializer=_init_local_worker,
+                    initargs=(self.model_name,),
+                )
+            return self._pool
+
+    def _get_query_embedding(self, query):
+        return self._get_pool().submit(_local_query_embedding, query).result()
+
+    async def _aget_query_embedding(self, query):
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text):
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts):
+        size = math.ceil(len(texts) / self._workers)
+        chunks = [texts[start:start + size] for start in range(0, len(texts), size)]
+        return [embedding for result in self._get_pool().map(_local_text_embeddings, chunks) for embedding in result]
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+_local_pools = {}
+_local_pools_lock = threading.Lock()
+
+
+def get_local_embedding_pool(model_name):
+    """Return the shared process pool embedding model for model_name, so rebuilds reuse its workers"""
+    with _local_pools_lock:
+        if model_name not in _local_pools:
+            _local_pools[model_name] = LocalEmbeddingPool(model_name)
+        return _local_pools[model_name]
@@ -0,0 +1,369 @@
+import json
+import os
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from fpdf import FPDF
+from openai import OpenAI
+from sqlalchemy import bindparam, text
+from dotenv import load_dotenv
+from evaluationCache import evaluation_key, get_evaluation_cache
+from jobs import JobRegistry, estimate_eta
+from transcriptStore import read_transcript
+from tools import create_database_connection
+
+load_dotenv(dotenv_path=".env.local")
+
+EVALUATION_MODEL = os.environ.get("EVALUATION_MODEL", "gpt-4o")
+
+# Evaluations run concurrently on their own pool, each limited to a timeout
+EVALUATION_WORKERS = int(os.environ.get("EVALUATION_WORKERS", "4"))
+EVALUATION_TIMEOUT_SECONDS = float(os.environ.get("EVALUATION_TIMEOUT_SECONDS", "120"))
+
+# Calls evaluated at once by a batch evaluation
+EVALUATION_BATCH_CONCURRENCY = int(os.environ.get("EVALUATION_BATCH_CONCURRENCY", str(EVALUATION_WORKERS)))
+
+# Batch evaluations run at once; others queue on their own pool, so they
+# never hold up ingestion jobs or single evaluations
+EVALUATION_BATCH_JOB_WORKERS = int(os.environ.get("EVALUATION_BATCH_JOB_WORKERS", "1"))
+
+# Reports of evaluation jobs are kept here, named by job id, until they
+# are older than EVALUATION_REPORT_RETENTION_SECONDS
+EVALUATIONS_DIR = os.environ.get("EVALUATIONS_DIR", "./evaluations")
+REPORT_RETENTION_SECONDS = float(os.environ.get("EVALUATION_REPORT_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+
+def get_transcript_path(engine, call_id):
+    """Return the transcript path recorded for a call, or None if there is no such call"""
+    with engine.connect() as connection:
+        query = text("SELECT Grabacion FROM Calls WHERE Id = :call_id")
+        result = connection.execute(query, {"call_id": call_id}).fetchone()
+    return result[0] if result else None
+
+
+def get_transcript_paths(engine, call_ids=None, start_date=None, end_date=None):
+    """
+    Return {call id: transcript path} for a list of calls or the calls started between two dates, in one query.
+
+    end_date is inclusive.
+    """
+    if call_ids is not None:
+        if not call_ids:
+            return {}
+        query = text("SELECT Id, Grabacion FROM Calls WHERE Id IN :call_ids").bindparams(
+            bindparam("call_ids", expanding=True)
+        )
+        params = {"call_ids": list(call_ids)}
+    else:
+        query = text("""
+            SELECT Id, Grabacion FROM Calls
+            WHERE HoraInicio >= :start AND HoraInicio < :end
+            ORDER BY HoraInicio
+        """)
+        params = {"start": start_date, "end": end_date + timedelta(days=1)}
+
+    with engine.connect() as connection:
+        return {row[0]: row[1] for row in connection.execute(query, params)}
+
+
+def format_conversation(transcript_data):
+    """Format a transcript as "Role: message" lines for evaluation"""
+    conversation = []
+    for item in transcript_data.get("items", []):
+        if "content" in item and item["content"]:
+            role = "Assistant" if item["role"] == "assistant" else "User"
+            content = item["content"][0] if item["content"] else ""
+            conversation.append(f"{role}: {content}")
+
+    return "\n".join(conversation)
+
+
+def evaluate_conversation(conversation_text, evaluation_prompt, timeout=EVALUATION_TIMEOUT_SECONDS):
+    """Have the evaluation model assess a conversation against the evaluation prompt"""
+    client = OpenAI(timeout=timeout, max_retries=0)
+    response = client.chat.completions.create(
+        model=EVALUATION_MODEL,
+        messages=[
+            {"role": "system",
+             "content": "You are an expert call evaluator. Analyze the conversation and provide detailed feedback."},
+            {"role": "user",
+             "content": f"Evaluation instructions: {evaluation_prompt}\n\nConversation transcript:\n{conversation_text}"}
+        ]
+    )
+
+    return response.choices[0].message.content
+
+
+class ReportTemplate:
+    """
+    Layout of the evaluation report PDF.
+
+    One template is shared by every report; each render lays out a new
+    document in memory and returns its bytes.
+    """
+
+    def __init__(self, title="Reporte de Evaluacion de Llamadas", font="Arial", title_size=16, body_size=12,
+                 line_height=10, width=190):
+        self.title = title
+        self.font = font
+        self.title_size = title_size
+        self.body_size = body_size
+        self.line_height = line_height
+        self.width = width
+
+    def _heading(self, pdf, txt):
+        pdf.set_font(self.font, 'B', self.body_size)
+        pdf.cell(200, self.line_height, txt=txt, ln=True)
+
+    def render(self, call_id, evaluation_prompt, evaluation_result):
+        """Return the PDF report of an evaluation as bytes"""
+        pdf = FPDF()
+        pdf.add_page()
+
+        # Add title
+        pdf.set_font(self.font, 'B', self.title_size)
+        pdf.cell(200, self.line_height, txt=self.title, ln=True, align='C')
+        pdf.ln(10)
+
+        # Add evaluation details
+        self._heading(pdf, f"Id de Llamada: {call_id}")
+        self._heading(pdf, "Criterios de Evaluacion:")
+        pdf.set_font(self.font, size=self.body_size)
+        pdf.multi_cell(self.width, self.line_height, txt=evaluation_prompt)
+        pdf.ln(10)
+
+        # Add evaluation results
+        self._heading(pdf, "Evaluation Results:")
+        pdf.set_font(self.font, size=self.body_size)
+
+        # Split by paragraphs and add to PDF
+        for paragraph in evaluation_result.split("\n\n"):
+            pdf.multi_cell(self.width, self.line_height, txt=paragraph)
+            pdf.ln(5)
+
+        # FPDF 1.7 returns the document as a latin-1 str, fpdf2 as a bytearray
+        output = pdf.output(dest="S")
+        return output.encode("latin-1") if isinstance(output, str) else bytes(output)
+
+
+REPORT_TEMPLATE = ReportTemplate()
+
+
+def report_path(job_id):
+    # Absolute, since Flask resolves relative paths against the app's directory
+    return os.path.abspath(os.path.join(EVALUATIONS_DIR, f"{job_id}.pdf"))
+
+
+def save_report(path, data):
+    """Write a report to the report store, atomically"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(data)
+    os.replace(f"{path}.tmp", path)
+
+
+def cleanup_reports(retention=REPORT_RETENTION_SECONDS):
+    """Delete stored reports older than retention seconds"""
+    if not os.path.isdir(EVALUATIONS_DIR):
+        return
+    cutoff = time.time() - retention
+    for entry in os.scandir(EVALUATIONS_DIR):
+        if entry.is_file() and entry.stat().st_mtime < cutoff:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+def evaluate_call(call_id, conversation_text, evaluation_prompt, timeout=EVALUATION_TIMEOUT_SECONDS):
+    """
+    Evaluate a conversation and render its report.
+
+    Evaluations already made for the same call, conversation, prompt and
+    model are served from the evaluation cache. Returns the evaluation
+    text, the PDF bytes and whether they came from the cache.
+    """
+    cache = get_evaluation_cache()
+    key = evaluation_key(EVALUATION_MODEL, evaluation_prompt, conversation_text, call_id)
+
+    cached = cache.get(key)
+    if cached is not None:
+        evaluation_result, pdf = cached
+        return evaluation_result, pdf, True
+
+    evaluation_result = evaluate_conversation(conversation_text, evaluation_prompt, timeout=timeout)
+    pdf = REPORT_TEMPLATE.render(call_id, evaluation_prompt, evaluation_result)
+    cache.put(key, evaluation_result, pdf)
+    return evaluation_result, pdf, False
+
+
+def evaluate_call_id(call_id, evaluation_prompt, job=None):
+    """
+    Evaluate the call with the given id within EVALUATION_TIMEOUT_SECONDS.
+
+    Returns the evaluation text, the PDF bytes and whether they came from
+    the cache. Raises LookupError if there is no such call.
+    """
+    deadline = time.monotonic() + EVALUATION_TIMEOUT_SECONDS
+
+    engine = create_database_connection()
+    if engine is None:
+        raise RuntimeError("Failed to connect to database")
+
+    transcript_path = get_transcript_path(engine, call_id)
+    if transcript_path is None:
+        raise LookupError(f"Call with ID {call_id} not found")
+    if job is not None:
+        job.update(stage="evaluating")
+
+    conversation_text = format_conversation(read_transcript(transcript_path))
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError(f"Evaluation timed out after {EVALUATION_TIMEOUT_SECONDS:.0f}s")
+    return evaluate_call(call_id, conversation_text, evaluation_prompt, timeout=remaining)
+
+
+def run_evaluation(job, call_id, evaluation_prompt):
+    """Evaluate a call as a job, keeping the report PDF in the report store. Returns the evaluation text."""
+    evaluation_result, pdf, cached = evaluate_call_id(call_id, evaluation_prompt, job)
+
+    pdf_path = report_path(job.id)
+    save_report(pdf_path, pdf)
+
+    return {
+        "call_id": call_id,
+        "evaluation": evaluation_result,
+        "pdf": os.path.basename(pdf_path),
+        "cached": cached,
+    }
+
+
+_registry = None
+_batch_registry = None
+_registry_lock = threading.Lock()
+
+
+def evaluate_now(call_id, evaluation_prompt):
+    """
+    Evaluate a call on the evaluation pool and wait for it, without keeping a job or report file.
+
+    Returns the evaluation text, the PDF bytes and whether they came from
+    the cache.
+    """
+    future = get_evaluation_registry().run(evaluate_call_id, call_id, evaluation_prompt)
+    return future.result(timeout=EVALUATION_TIMEOUT_SECONDS + 30)
+
+
+def get_evaluation_registry():
+    """Return the job registry evaluations run on, with EVALUATION_WORKERS threads"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = JobRegistry(max_workers=EVALUATION_WORKERS)
+    return _registry
+
+
+def get_batch_evaluation_registry():
+    """Return the job registry batch evaluations run on, with EVALUATION_BATCH_JOB_WORKERS threads"""
+    global _batch_registry
+    if _batch_registry is None:
+        with _registry_lock:
+            if _batch_registry is None:
+                _batch_registry = JobRegistry(max_workers=EVALUATION_BATCH_JOB_WORKERS)
+    return _batch_registry
+
+
+def submit_evaluation(call_id, evaluation_prompt):
+    """Queue the evaluation of a call and return the job state"""
+    cleanup_reports()
+    return get_evaluation_registry().submit(
+        "evaluation", run_evaluation, {"call_id": call_id, "evaluation_prompt": evaluation_prompt}
+    )
+
+
+def _evaluate_batch_call(call_id, transcript_path, evaluation_prompt):
+    """Evaluate one call of a batch, returning its summary entry and PDF bytes"""
+    try:
+        conversation_text = format_conversation(read_transcript(transcript_path))
+        evaluation_result, pdf, cached = evaluate_call(call_id, conversation_text, evaluation_prompt)
+        return {"call_id": call_id, "status": "succeeded", "cached": cached, "evaluation": evaluation_result}, pdf
+    except Exception as e:
+        print(f"Error evaluating call {call_id}: {e}")
+        return {"call_id": call_id, "status": "failed", "error": str(e)}, None
+
+
+def batch_path(job_id):
+    # Absolute, since Flask resolves relative paths against the app's directory
+    return os.path.abspath(os.path.join(EVALUATIONS_DIR, f"{job_id}.zip"))
+
+
+def run_batch_evaluation(job, evaluation_prompt, call_ids=None, start_date=None, end_date=None):
+    """
+    Evaluate many calls as one job, EVALUATION_BATCH_CONCURRENCY at a time.
+
+    Writes a ZIP with the PDF report of every evaluated call and a
+    summary.json of all results. Returns the per-call statuses.
+    """
+    engine = create_database_connection()
+    if engine is None:
+        raise RuntimeError("Failed to connect to database")
+
+    if start_date is not None:
+        start_date = date.fromisoformat(start_date)
+        end_date = date.fromisoformat(end_date)
+    transcript_paths = get_transcript_paths(engine, call_ids, start_date, end_date)
+
+    summary = []
+    if call_ids is not None:
+        found = {str(call_id) for call_id in transcript_paths}
+        summary = [
+            {"call_id": call_id, "status": "failed", "error": f"Call with ID {call_id} not found"}
+            for call_id in call_ids if str(call_id) not in found
+        ]
+
+    total = len(transcript_paths)
+    job.update(total=total, completed=0)
+
+    zip_path = batch_path(job.id)
+    os.makedirs(EVALUATIONS_DIR, exist_ok=True)
+    with zipfile.ZipFile(f"{zip_path}.tmp", "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        with ThreadPoolExecutor(max_workers=EVALUATION_BATCH_CONCURRENCY, thread_name_prefix="evaluation") as pool:
+            futures = [
+                pool.submit(_evaluate_batch_call, call_id, path, evaluation_prompt)
+                for call_id, path in transcript_paths.items()
+            ]
+            for completed, future in enumerate(futures, start=1):
+                entry, pdf = future.result()
+                summary.append(entry)
+                if pdf is not None:
+                    archive.writestr(f"evaluation_{entry['call_id']}.pdf", pdf)
+                job.update(completed=completed,
+                           eta_seconds=estimate_eta(job.state["started_at"], completed, total))
+
+        archive.writestr("summary.json", json.dumps({
+            "evaluation_prompt": evaluation_prompt,
+            "calls": summary,
+        }, ensure_ascii=False, indent=2, default=str))
+    os.replace(f"{zip_path}.tmp", zip_path)
+
+    return {
+        "total": len(summary),
+        "succeeded": sum(1 for entry in summary if entry["status"] == "succeeded"),
+        "failed": sum(1 for entry in summary if entry["status"] == "failed"),
+        "zip": os.path.basename(zip_path),
+        "calls": [{key: value for key, value in entry.items() if key != "evaluation"} for entry in summary],
+    }
+
+
+def submit_batch_evaluation(evaluation_prompt, call_ids=None, start_date=None, end_date=None):
+    """Queue the evaluation of a list of calls, or of the calls between two ISO dates, and return the job state"""
+    cleanup_reports()
+    return get_batch_evaluation_registry().submit("evaluation-batch", run_batch_evaluation, {
+        "evaluation_prompt": evaluation_prompt,
+        "call_ids": call_ids,
+        "start_date": start_date,
+        "end_date": end_date,
+    })
@@ -0,0 +1,117 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv(dotenv_path=".env.local")
+
+CACHE_PATH = os.environ.get("EVALUATION_CACHE_PATH", "./evaluation_cache.sqlite3")
+CACHE_TTL_SECONDS = float(os.environ.get("EVALUATION_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+CACHE_MAX_BYTES = int(os.environ.get("EVALUATION_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+
+def evaluation_key(model_name, evaluation_prompt, conversation_text, call_id):
+    """
+    Hash of everything an evaluation report depends on.
+
+    The call id is part of the key because it is printed in the report.
+    """
+    parts = (model_name, evaluation_prompt, conversation_text, str(call_id))
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+class EvaluationCache:
+    """
+    SQLite cache of evaluation texts and their rendered PDF reports.
+
+    Entries expire ttl seconds after they were stored, and the least
+    recently used ones are evicted when the cache grows past max_bytes.
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL_SECONDS, max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS evaluations (
+                    key TEXT PRIMARY KEY,
+                    evaluation TEXT NOT NULL,
+                    pdf BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS evaluations_last_used ON evaluations (last_used)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key):
+        """Return (evaluation text, PDF bytes) for the key, or None if not cached or expired"""
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT evaluation, pdf FROM evaluations WHERE key = ? AND created_at >= ?",
+                (key, time.time() - self.ttl),
+            ).fetchone()
+            if row is None:
+                return None
+
+            conn.execute("UPDATE evaluations SET last_used = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+            return row[0], bytes(row[1])
+
+    def put(self, key, evaluation, pdf):
+        """Store an evaluation and its PDF, evicting expired and least recently used entries"""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO evaluations (key, evaluation, pdf, size, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, evaluation, pdf, len(pdf) + len(evaluation.encode("utf-8")), now, now),
+            )
+            self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn):
+        conn.execute("DELETE FROM evaluations WHERE created_at < ?", (time.time() - self.ttl,))
+
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM evaluations").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        excess = total - self.max_bytes
+        evicted = []
+        for key, size in conn.execute("SELECT key, size FROM evaluations ORDER BY last_used"):
+            evicted.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany("DELETE FROM evaluations WHERE key = ?", evicted)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_evaluation_cache():
+    """Return the shared evaluation cache for this process"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EvaluationCache()
+    return _cache
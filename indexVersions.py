@@ -0,0 +1,108 @@
+import os
+import shutil
+import time
+import uuid
+from dotenv import load_dotenv
+
+load_dotenv(dotenv_path=".env.local")
+
+INDEX_DIR = os.environ.get("VECTOR_INDEX_DIR", "./vector_index")
+
+# Number of promoted index versions kept on disk, including the current one.
+# Older versions stay around briefly so readers that loaded them can finish.
+KEEP_VERSIONS = int(os.environ.get("VECTOR_INDEX_KEEP_VERSIONS", "3"))
+
+VERSIONS_DIR = "versions"
+CURRENT_FILE = "CURRENT"
+STAGING_SUFFIX = ".staging"
+
+
+def current_version(index_root=INDEX_DIR):
+    """Return the name of the promoted index version, or None if the index isn't versioned yet"""
+    try:
+        with open(os.path.join(index_root, CURRENT_FILE), "r") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def resolve_index_dir(index_root=INDEX_DIR):
+    """
+    Return the directory holding the current index files.
+
+    Indexes built before versioning keep their files directly in index_root,
+    which is returned as is until a version is promoted.
+    """
+    version = current_version(index_root)
+    if version is None:
+        return index_root
+    return os.path.join(index_root, VERSIONS_DIR, version)
+
+
+def create_staging_dir(index_root=INDEX_DIR, copy_current=True):
+    """
+    Create a directory to build the next index version in.
+
+    With copy_current the files of the current index are copied in, so the
+    staging index can be updated incrementally without touching the live one.
+    """
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    staging_dir = os.path.join(index_root, VERSIONS_DIR, name + STAGING_SUFFIX)
+
+    current_dir = resolve_index_dir(index_root)
+    if copy_current and os.path.isdir(current_dir):
+        shutil.copytree(
+            current_dir,
+            staging_dir,
+            ignore=lambda path, names: [n for n in names if n in (VERSIONS_DIR, CURRENT_FILE)],
+        )
+    else:
+        os.makedirs(staging_dir)
+
+    return staging_dir
+
+
+def discard_staging_dir(staging_dir):
+    shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def promote(staging_dir, index_root=INDEX_DIR):
+    """
+    Make a fully written staging directory the current index version.
+
+    The CURRENT pointer is replaced atomically, so readers see either the
+    previous version or the new one, never a partially written index.
+    Returns the name of the promoted version.
+    """
+    name = os.path.basename(staging_dir)
+    if name.endswith(STAGING_SUFFIX):
+        name = name[:-len(STAGING_SUFFIX)]
+    os.replace(staging_dir, os.path.join(index_root, VERSIONS_DIR, name))
+
+    pointer_tmp = os.path.join(index_root, f"{CURRENT_FILE}.{os.getpid()}.tmp")
+    with open(pointer_tmp, "w") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer_tmp, os.path.join(index_root, CURRENT_FILE))
+    print(f"Promoted vector index version {name}")
+
+    prune_versions(index_root)
+    return name
+
+
+def prune_versions(index_root=INDEX_DIR, keep=KEEP_VERSIONS):
+    """Delete promoted versions beyond the newest `keep`, never the current one"""
+    versions_dir = os.path.join(index_root, VERSIONS_DIR)
+    current = current_version(index_root)
+    versions = sorted(
+        name for name in os.listdir(versions_dir)
+        if not name.endswith(STAGING_SUFFIX) and name != current
+    )
+
+    for name in versions[:max(len(versions) - (keep - 1), 0)]:
+        try:
+            shutil.rmtree(os.path.join(versions_dir, name))
+        except OSError as e:
+            # Files of an old version may still be open by a reader; retry on the next promotion
+            print(f"Could not remove index version {name}: {e}")
@@ -0,0 +1,248 @@
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv(dotenv_path=".env.local")
+
+# Job state is kept as one JSON file per job, so every API worker process
+# can report on jobs started by another one
+JOBS_DIR = os.environ.get("JOBS_DIR", "./jobs")
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+
+# Finished jobs older than this are deleted
+JOB_RETENTION_SECONDS = float(os.environ.get("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+FINISHED_STATES = ("succeeded", "failed")
+
+# A coalescing lock whose job file can't be read is only cleared once it is
+# older than this, so a job another worker is still starting isn't taken
+# for a stale one
+LOCK_GRACE_SECONDS = 30
+
+
+def estimate_eta(started_at, done, total):
+    """Seconds left at the average rate so far, or None when it can't be estimated yet"""
+    if not started_at or not done or not total or done >= total:
+        return None
+    elapsed = time.time() - started_at
+    return round(elapsed / done * (total - done), 1)
+
+
+def pid_alive(pid):
+    """Whether a process with this pid is running on this machine"""
+    if os.name == "nt":
+        # os.kill would terminate the process on Windows; assume it is alive
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Job:
+    """A background job whose state is saved to disk on every update"""
+
+    def __init__(self, registry, kind, params=None):
+        self.registry = registry
+        self.id = uuid.uuid4().hex
+        self.state = {
+            "job_id": self.id,
+            "kind": kind,
+            "status": "queued",
+            "params": params or {},
+            "progress": {},
+            "result": None,
+            "error": None,
+            "error_type": None,
+            "pid": os.getpid(),
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+        }
+
+    def update(self, **progress):
+        """Merge progress fields into the job state"""
+        self.state["progress"].update(progress)
+        self.registry.save(self.state)
+
+    def _set(self, **fields):
+        self.state.update(fields)
+        self.registry.save(self.state)
+
+
+class JobRegistry:
+    """
+    Runs jobs on a thread pool and keeps their state in JOBS_DIR.
+
+    Jobs submitted with coalesce=True share a lock file per kind: while one
+    is queued or running, submitting another returns the active job instead
+    of starting a new one, across worker processes.
+    """
+
+    def __init__(self, jobs_dir=JOBS_DIR, max_workers=JOB_WORKERS):
+        self.jobs_dir = jobs_dir
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        os.makedirs(jobs_dir, exist_ok=True)
+
+    def _path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _lock_path(self, kind):
+        return os.path.join(self.jobs_dir, f"{kind}.lock")
+
+    def save(self, state):
+        path = self._path(state["job_id"])
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f, default=str)
+        os.replace(tmp_path, path)
+
+    def get(self, job_id):
+        """Return the state of a job, or None if there is no such job"""
+        if not job_id or not all(c in "0123456789abcdef" for c in job_id):
+            return None
+        try:
+            with open(self._path(job_id), "r") as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        if state["status"] not in FINISHED_STATES and not pid_alive(state["pid"]):
+            state.update(status="failed", error="The process running the job exited", finished_at=time.time())
+            self.save(state)
+        return state
+
+    def _active_job(self, kind):
+        """Return the state of the coalesced job of this kind still in progress, clearing stale locks"""
+        try:
+            with open(self._lock_path(kind), "r") as f:
+                job_id = f.read().strip()
+        except FileNotFoundError:
+            return None
+
+        state = self.get(job_id) if job_id else None
+        if state is not None and state["status"] not in FINISHED_STATES:
+            return state
+
+        if state is None:
+            try:
+                age = time.time() - os.stat(self._lock_path(kind)).st_mtime
+            except FileNotFoundError:
+                return None
+            if age < LOCK_GRACE_SECONDS:
+                # Not stale yet; the caller tries to acquire the lock again
+                time.sleep(0.05)
+                return None
+
+        self._release(kind, job_id)
+        return None
+
+    def _acquire(self, kind, job_id):
+        """Take the lock of a kind for job_id; the lock file appears with the id already in it"""
+        tmp_path = f"{self._lock_path(kind)}.{job_id}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(job_id)
+        try:
+            os.link(tmp_path, self._lock_path(kind))
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp_path)
+        return True
+
+    def _release(self, kind, job_id):
+        """Remove the lock of a kind if it is still held by job_id, never a newer job's lock"""
+        path = self._lock_path(kind)
+        try:
+            with open(path, "r") as f:
+                if f.read().strip() != job_id:
+                    return
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def submit(self, kind, fn, params=None, coalesce=False):
+        """
+        Start fn(job, **params) in the background and return the job state.
+
+        The returned state has "coalesced" set when an active job of the
+        same kind was returned instead of starting a new one.
+        """
+        self.cleanup()
+        job = Job(self, kind, params)
+
+        # The job is saved before it takes the lock, so a worker that finds
+        # the lock can always read the job holding it
+        self.save(job.state)
+        if coalesce:
+            with self._lock:
+                while not self._acquire(kind, job.id):
+                    active = self._active_job(kind)
+                    if active is not None:
+                        os.remove(self._path(job.id))
+                        return {**active, "coalesced": True}
+
+        self._executor.submit(self._run, job, fn, coalesce)
+        return {**job.state, "coalesced": False}
+
+    def run(self, fn, *args, **kwargs):
+        """Run fn on the registry's pool without tracking it as a job. Returns a Future."""
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def wait(self, job_id, timeout=None, interval=0.5):
+        """Wait for a job to finish and return its state; returns the unfinished state on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            state = self.get(job_id)
+            if state is None or state["status"] in FINISHED_STATES:
+                return state
+            if deadline is not None and time.monotonic() >= deadline:
+                return state
+            time.sleep(interval)
+
+    def _run(self, job, fn, coalesce):
+        job._set(status="running", started_at=time.time())
+        try:
+            result = fn(job, **job.state["params"])
+            finished = {"status": "succeeded", "result": result}
+        except Exception as e:
+            traceback.print_exc()
+            finished = {"status": "failed", "error": str(e), "error_type": type(e).__name__}
+
+        # The lock goes before the job is marked finished: a submit that sees
+        # the finished job takes the lock as stale and may start a new job
+        if coalesce:
+            self._release(job.state["kind"], job.id)
+        job._set(**finished, finished_at=time.time())
+
+    def cleanup(self, retention=JOB_RETENTION_SECONDS):
+        """Delete the state files of jobs that finished more than retention seconds ago"""
+        cutoff = time.time() - retention
+        for entry in os.scandir(self.jobs_dir):
+            if entry.name.endswith(".json") and entry.stat().st_mtime < cutoff:
+                state = self.get(entry.name[:-len(".json")])
+                if state is not None and state["status"] in FINISHED_STATES:
+                    os.remove(entry.path)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_job_registry():
+    """Return the shared job registry for this process"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = JobRegistry()
+    return _registry
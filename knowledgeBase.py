@@ -0,0 +1,182 @@
+import json
+import os
+import shutil
+from dotenv import load_dotenv
+
+load_dotenv(dotenv_path=".env.local")
+
+KNOWLEDGE_BASE_DIR = os.environ.get("KNOWLEDGE_BASE_DIR", "vectordb/knowledge_base")
+
+# "jsonl" writes the export as a few shard files, "files" as one file per record
+EXPORT_FORMAT = os.environ.get("EXPORT_FORMAT", "jsonl")
+EXPORT_SHARD_SIZE = int(os.environ.get("EXPORT_SHARD_SIZE", "10000"))
+
+SHARD_PREFIX = "kb-"
+SHARD_SUFFIX = ".jsonl"
+
+
+def decode_text(raw):
+    """Decode exported bytes; files written on Windows use the platform encoding rather than UTF-8"""
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return raw.decode("cp1252", errors="replace")
+
+
+def is_shard(name):
+    return name.startswith(SHARD_PREFIX) and name.endswith(SHARD_SUFFIX)
+
+
+def shard_paths(export_dir=KNOWLEDGE_BASE_DIR):
+    if not os.path.isdir(export_dir):
+        return []
+    return [os.path.join(export_dir, name) for name in sorted(os.listdir(export_dir)) if is_shard(name)]
+
+
+class ShardWriter:
+    """
+    Writes export records ({"id": ..., "text": ...}) to numbered JSONL shards as they arrive.
+
+    Shards are written to a staging directory and only replace the previous
+    export on commit(), so the old export stays readable while the new one
+    is streamed. Committing also removes per-record files starting with one
+    of record_prefixes, left from the "files" format.
+    """
+
+    def __init__(self, export_dir=KNOWLEDGE_BASE_DIR, shard_size=EXPORT_SHARD_SIZE, record_prefixes=()):
+        self.export_dir = export_dir
+        self.shard_size = shard_size
+        self.record_prefixes = tuple(record_prefixes)
+        self.staging_dir = os.path.join(export_dir, ".staging")
+        self.count = 0
+        self._names = []
+        self._shard = None
+
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+        os.makedirs(self.staging_dir)
+
+    def write(self, record):
+        if self.count % self.shard_size == 0:
+            if self._shard is not None:
+                self._shard.close()
+            self._names.append(f"{SHARD_PREFIX}{len(self._names):05d}{SHARD_SUFFIX}")
+            self._shard = open(os.path.join(self.staging_dir, self._names[-1]), "w", encoding="utf-8")
+
+        self._shard.write(json.dumps(record, ensure_ascii=False))
+        self._shard.write("\n")
+        self.count += 1
+
+    def commit(self):
+        """Replace the previous export with the shards written so far"""
+        if self._shard is not None:
+            self._shard.close()
+            self._shard = None
+        for name in self._names:
+            os.replace(os.path.join(self.staging_dir, name), os.path.join(self.export_dir, name))
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+        for path in shard_paths(self.export_dir):
+            if os.path.basename(path) not in self._names:
+                os.remove(path)
+        remove_record_files(self.export_dir, self.record_prefixes, set())
+        return [os.path.join(self.export_dir, name) for name in self._names]
+
+    def close(self):
+        """Stop writing; shards that were not committed are discarded"""
+        if self._shard is not None:
+            self._shard.close()
+            self._shard = None
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+
+class FileWriter:
+    """
+    Writes export records as one file per record, named by record id.
+
+    Committing removes per-record files that were not written by this
+    export and any shards from the "jsonl" format.
+    """
+
+    def __init__(self, export_dir=KNOWLEDGE_BASE_DIR, record_prefixes=()):
+        self.export_dir = export_dir
+        self.record_prefixes = tuple(record_prefixes)
+        self.count = 0
+        self._written = set()
+        os.makedirs(export_dir, exist_ok=True)
+
+    def write(self, record):
+        with open(os.path.join(self.export_dir, record["id"]), "w", encoding="utf-8") as f:
+            f.write(record["text"])
+        self._written.add(record["id"])
+        self.count += 1
+
+    def commit(self):
+        remove_record_files(self.export_dir, self.record_prefixes, self._written)
+        for path in shard_paths(self.export_dir):
+            os.remove(path)
+        return [os.path.join(self.export_dir, name) for name in sorted(self._written)]
+
+    def close(self):
+        pass
+
+
+def open_writer(export_dir=KNOWLEDGE_BASE_DIR, export_format=EXPORT_FORMAT, record_prefixes=()):
+    """Return a writer for the export format"""
+    if export_format == "jsonl":
+        return ShardWriter(export_dir, record_prefixes=record_prefixes)
+    if export_format == "files":
+        return FileWriter(export_dir, record_prefixes=record_prefixes)
+    raise ValueError(f"Unknown export format: {export_format}")
+
+
+def write_shards(records, export_dir=KNOWLEDGE_BASE_DIR, shard_size=EXPORT_SHARD_SIZE):
+    """Write export records to JSONL shards, replacing the previous shards. Returns the shard paths."""
+    writer = ShardWriter(export_dir, shard_size)
+    for record in records:
+        writer.write(record)
+    return writer.commit()
+
+
+def remove_record_files(export_dir, prefixes, keep_names):
+    """
+    Delete per-record export files starting with one of the prefixes that are not in keep_names.
+
+    Rows deleted from the database leave their old files behind; removing
+    them lets the index update see the deletion.
+    """
+    removed = []
+    if not prefixes:
+        return removed
+
+    for name in os.listdir(export_dir):
+        if name.startswith(tuple(prefixes)) and name not in keep_names:
+            os.remove(os.path.join(export_dir, name))
+            removed.append(name)
+
+    if removed:
+        print(f"Removed {len(removed)} stale files from {export_dir}/")
+    return removed
+
+
+def read_records(export_dir=KNOWLEDGE_BASE_DIR):
+    """
+    Yield the exported records of a knowledge base directory.
+
+    Reads the JSONL shards and any per-record files from the "files"
+    export format, each file becoming a record with its name as id.
+    """
+    if not os.path.isdir(export_dir):
+        return
+
+    for name in sorted(os.listdir(export_dir)):
+        path = os.path.join(export_dir, name)
+        if not os.path.isfile(path) or name.startswith(".") or name.endswith(".tmp"):
+            continue
+
+        with open(path, "rb") as f:
+            if is_shard(name):
+                for line in f:
+                    if line.strip():
+                        yield json.loads(decode_text(line))
+            else:
+                yield {"id": name, "text": decode_text(f.read())}
@@ -1,14 +1,46 @@
+import atexit
+import subprocess
 import threading
 import sys
 import os
-from api import start_api_server
+from dotenv import load_dotenv
+from serve import API_GRACEFUL_TIMEOUT_SECONDS
+
+load_dotenv(dotenv_path=".env.local")
+
+# How main.py runs the API next to the agent: "process" starts serve.py as a
+# separate process, "thread" runs the Flask development server in this one,
+# and "none" leaves the API to be started on its own with `python serve.py`
+API_SERVER_MODE = os.environ.get("API_SERVER_MODE", "process")
+
+
+def start_api_process():
+    """Start the production API server as a child process, stopped when this one exits"""
+    serve_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "serve.py")
+    process = subprocess.Popen([sys.executable, serve_script])
+
+    def stop():
+        if process.poll() is None:
+            # The server stops gracefully on SIGTERM, finishing in-flight requests
+            process.terminate()
+            try:
+                process.wait(timeout=API_GRACEFUL_TIMEOUT_SECONDS + 5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    atexit.register(stop)
+    return process
 
 
 def main():
     """Main entry point that runs both the API server and LiveKit agent"""
-    # Start API server in a background thread
-    api_thread = threading.Thread(target=start_api_server, daemon=True)
-    api_thread.start()
+    if API_SERVER_MODE == "process":
+        start_api_process()
+    elif API_SERVER_MODE == "thread":
+        # Development only: the API shares this process and its GIL with the agent
+        from api import start_api_server
+        api_thread = threading.Thread(target=start_api_server, daemon=True)
+        api_thread.start()
 
     print("Both services starting. Use Ctrl+C to stop.")
 
@@ -23,4 +55,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
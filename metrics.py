@@ -0,0 +1,381 @@
+import atexit
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from jobs import pid_alive
+
+load_dotenv(dotenv_path=".env.local")
+
+# Every process (agent job processes, API workers) keeps its own metrics and
+# writes a snapshot to METRICS_DIR/<pid>-<start time>.json; /metrics adds
+# them all up
+METRICS_DIR = os.environ.get("METRICS_DIR", "./metrics")
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", "10"))
+
+# Snapshots of processes that exited (one per call, as every call runs in
+# its own job process) are merged into this file by /metrics and deleted
+EXITED_FILE = "exited.json"
+LOCK_FILE = "merge.lock"
+
+# How long /metrics waits for another process merging snapshots, and when
+# a lock left by a process that died while merging is broken
+LOCK_WAIT_SECONDS = 5
+LOCK_STALE_SECONDS = 60
+
+# Upper bounds, in seconds, of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 7.5, 10, 20, 30, 60)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def bucket_quantile(q, buckets, count):
+    """
+    Estimate the q quantile of a histogram from its per-bucket counts.
+
+    buckets holds one count per bound in BUCKETS plus one for +Inf.
+    Values are assumed evenly spread within a bucket, like Prometheus'
+    histogram_quantile; the +Inf bucket is reported as the last bound.
+    """
+    if not count:
+        return None
+    rank = q * count
+    seen = 0
+    for i, n in enumerate(buckets):
+        if seen + n >= rank and n:
+            if i >= len(BUCKETS):
+                return BUCKETS[-1]
+            lower = BUCKETS[i - 1] if i else 0.0
+            return lower + (BUCKETS[i] - lower) * (rank - seen) / n
+        seen += n
+    return BUCKETS[-1]
+
+
+def _empty_histogram():
+    return {"buckets": [0] * (len(BUCKETS) + 1), "count": 0, "sum": 0.0}
+
+
+def _add_snapshot(counters, histograms, snapshot):
+    """Add the counters and histograms of a snapshot to running totals"""
+    for name, labels, value in snapshot["counters"]:
+        key = _key(name, labels)
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, histogram in snapshot["histograms"]:
+        total = histograms.setdefault(_key(name, labels), _empty_histogram())
+        total["buckets"] = [a + b for a, b in zip(total["buckets"], histogram["buckets"])]
+        total["count"] += histogram["count"]
+        total["sum"] += histogram["sum"]
+
+
+def _snapshot_lists(counters, histograms):
+    return {
+        "counters": [[name, dict(labels), value] for (name, labels), value in counters.items()],
+        "histograms": [
+            [name, dict(labels), {**histogram, "buckets": list(histogram["buckets"])}]
+            for (name, labels), histogram in histograms.items()
+        ],
+    }
+
+
+def _read_json(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def percentile(values, q):
+    """Return the q quantile of a list of values by nearest rank, or None when it is empty"""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+class Metrics:
+    """
+    Counters and latency histograms of this process.
+
+    Updates only touch memory; a background thread writes the snapshot file
+    every METRICS_FLUSH_SECONDS when something changed.
+    """
+
+    def __init__(self, metrics_dir=METRICS_DIR, flush_interval=METRICS_FLUSH_SECONDS):
+        self.metrics_dir = metrics_dir
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._dirty = False
+        self._pid = None
+        self._filename = None
+        self._thread = None
+
+    def _start(self):
+        # Called with the lock held. A forked child gets its own snapshot
+        # file and flusher thread. The start time in the file name keeps a
+        # process that reuses an old pid from overwriting its snapshot
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._filename = f"{self._pid}-{time.time_ns()}.json"
+            self._counters = {}
+            self._histograms = {}
+            self._thread = threading.Thread(target=self._run, name="metrics-flush", daemon=True)
+            self._thread.start()
+
+    def increment(self, name, value=1, **labels):
+        """Add value to a counter"""
+        key = _key(name, labels)
+        with self._lock:
+            self._start()
+            self._counters[key] = self._counters.get(key, 0) + value
+            self._dirty = True
+
+    def observe(self, name, seconds, **labels):
+        """Record a duration in a latency histogram"""
+        key = _key(name, labels)
+        with self._lock:
+            self._start()
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _empty_histogram()
+            i = 0
+            while i < len(BUCKETS) and seconds > BUCKETS[i]:
+                i += 1
+            histogram["buckets"][i] += 1
+            histogram["count"] += 1
+            histogram["sum"] += seconds
+            self._dirty = True
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Time the block and record it in the name histogram"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def _snapshot(self):
+        with self._lock:
+            self._dirty = False
+            return {
+                "pid": os.getpid(),
+                "updated_at": time.time(),
+                **_snapshot_lists(self._counters, self._histograms),
+            }
+
+    def flush(self):
+        """Write this process' snapshot file if anything changed since the last flush"""
+        if not self._dirty or self._pid != os.getpid():
+            return
+        snapshot = self._snapshot()
+        os.makedirs(self.metrics_dir, exist_ok=True)
+        _write_json(os.path.join(self.metrics_dir, self._filename), snapshot)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error writing metrics: {e}")
+
+    @contextmanager
+    def _merge_lock(self):
+        """Hold the lock on merging snapshots across processes; yields whether it was taken"""
+        path = os.path.join(self.metrics_dir, LOCK_FILE)
+        deadline = time.monotonic() + LOCK_WAIT_SECONDS
+        while True:
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.stat(path).st_mtime > LOCK_STALE_SECONDS:
+                        os.remove(path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.monotonic() >= deadline:
+                    yield False
+                    return
+                time.sleep(0.05)
+
+        try:
+            yield True
+        finally:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def collect(self):
+        """
+        Add up the snapshots of every process.
+
+        Snapshots of processes that exited are merged into EXITED_FILE and
+        deleted, so the files read stay bounded by the processes running.
+        The merged file lists the snapshots it holds until they are
+        deleted, so a snapshot is never counted twice.
+        """
+        self.flush()
+        if not os.path.isdir(self.metrics_dir):
+            return {}, {}
+
+        with self._merge_lock() as merging:
+            exited_path = os.path.join(self.metrics_dir, EXITED_FILE)
+            exited = _read_json(exited_path) or {"counters": [], "histograms": [], "merged": []}
+            merged = set(exited.get("merged", []))
+
+            exited_counters, exited_histograms = {}, {}
+            _add_snapshot(exited_counters, exited_histograms, exited)
+            counters, histograms = {}, {}
+            newly_exited = []
+
+            for entry in os.scandir(self.metrics_dir):
+                if not entry.name.endswith(".json") or entry.name == EXITED_FILE:
+                    continue
+                if entry.name in merged:
+                    # Already merged; the merge stopped before deleting it
+                    if merging:
+                        os.remove(entry.path)
+                    continue
+                snapshot = _read_json(entry.path)
+                if snapshot is None:
+                    continue
+
+                if merging and not pid_alive(snapshot["pid"]):
+                    _add_snapshot(exited_counters, exited_histograms, snapshot)
+                    newly_exited.append(entry)
+                else:
+                    _add_snapshot(counters, histograms, snapshot)
+
+            if newly_exited:
+                _write_json(exited_path, {
+                    **_snapshot_lists(exited_counters, exited_histograms),
+                    "merged": [entry.name for entry in newly_exited],
+                })
+                for entry in newly_exited:
+                    os.remove(entry.path)
+
+        _add_snapshot(counters, histograms, _snapshot_lists(exited_counters, exited_histograms))
+        return counters, histograms
+
+
+def _labels_text(labels, **extra):
+    pairs = list(labels) + [(k, v) for k, v in extra.items()]
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def render_prometheus(counters, histograms):
+    """
+    Format collected metrics in the Prometheus text format.
+
+    Each histogram also gets a <name>_quantile gauge with its p50, p95 and
+    p99 estimated from the buckets.
+    """
+    lines = []
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f"# TYPE {name} counter")
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f"{name}{_labels_text(labels)} {value}")
+
+    for name in sorted({name for name, _ in histograms}):
+        series = sorted(
+            ((labels, h) for (metric, labels), h in histograms.items() if metric == name), key=lambda item: item[0]
+        )
+
+        lines.append(f"# TYPE {name} histogram")
+        for labels, histogram in series:
+            cumulative = 0
+            for bound, n in zip(BUCKETS + ("+Inf",), histogram["buckets"]):
+                cumulative += n
+                lines.append(f"{name}_bucket{_labels_text(labels, le=bound)} {cumulative}")
+            lines.append(f"{name}_sum{_labels_text(labels)} {histogram['sum']:.6f}")
+            lines.append(f"{name}_count{_labels_text(labels)} {histogram['count']}")
+
+        lines.append(f"# TYPE {name}_quantile gauge")
+        for labels, histogram in series:
+            for q in QUANTILES:
+                value = bucket_quantile(q, histogram["buckets"], histogram["count"])
+                if value is not None:
+                    lines.append(f"{name}_quantile{_labels_text(labels, quantile=q)} {value:.6f}")
+
+    return "\n".join(lines) + "\n"
+
+
+class CallLatency:
+    """
+    Stage timings and usage of one call, summarized into the call's transcript.
+
+    Timings are grouped into turns by the id of the agent reply they led
+    to, when there is one.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.counts = {}
+        self.turns = {}
+
+    def add(self, stage, seconds, turn_id=None):
+        if seconds is None or seconds < 0:
+            return
+        self.stages.setdefault(stage, []).append(seconds)
+        if turn_id:
+            turn = self.turns.setdefault(turn_id, {})
+            turn[stage] = round(turn.get(stage, 0) + seconds, 4)
+
+    def count(self, name, value):
+        if value:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def summary(self):
+        """Per-stage count, p50, p95 and max in seconds, usage totals and per-turn timings"""
+        return {
+            "stages": {
+                stage: {
+                    "count": len(values),
+                    "p50": round(percentile(values, 0.5), 4),
+                    "p95": round(percentile(values, 0.95), 4),
+                    "max": round(max(values), 4),
+                }
+                for stage, values in self.stages.items()
+            },
+            "usage": self.counts,
+            "turns": list(self.turns.values()),
+        }
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """Return the metrics of this process"""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = Metrics()
+                atexit.register(_metrics.flush)
+    return _metrics
@@ -0,0 +1,651 @@
+import asyncio
+import dataclasses
+import os
+import random
+import time
+from collections import OrderedDict, deque
+from livekit import rtc
+from livekit.agents import APIConnectionError, llm, stt, tts, utils
+from livekit.agents.types import DEFAULT_API_CONNECT_OPTIONS, NOT_GIVEN
+from dotenv import load_dotenv
+from metrics import get_metrics, percentile
+
+load_dotenv(dotenv_path=".env.local")
+
+# Requests remembered per provider to compute its latency and error rate
+ROUTING_WINDOW = int(os.environ.get("PROVIDER_ROUTING_WINDOW", "50"))
+
+# A provider failing more than this share of its recent requests (or three
+# times in a row) is skipped for PROVIDER_COOLDOWN_SECONDS, then tried again
+ROUTING_MAX_ERROR_RATE = float(os.environ.get("PROVIDER_MAX_ERROR_RATE", "0.5"))
+ROUTING_MIN_REQUESTS = 5
+ROUTING_COOLDOWN_SECONDS = float(os.environ.get("PROVIDER_COOLDOWN_SECONDS", "30"))
+
+# Provider request ids remembered to tell the winners' metrics from the losers'
+METRICS_REQUESTS_KEPT = 256
+
+
+class ProviderStats:
+    """Rolling latency and error rate of one provider's recent requests"""
+
+    def __init__(self, window=ROUTING_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.consecutive_errors = 0
+        self.cooldown_until = 0.0
+
+    def record(self, latency=None, error=False):
+        self.outcomes.append(not error)
+        if error:
+            self.consecutive_errors += 1
+            if self.consecutive_errors >= 3 or (
+                len(self.outcomes) >= ROUTING_MIN_REQUESTS and self.error_rate > ROUTING_MAX_ERROR_RATE
+            ):
+                self.cooldown_until = time.monotonic() + ROUTING_COOLDOWN_SECONDS
+        else:
+            self.consecutive_errors = 0
+            self.latencies.append(latency)
+
+    @property
+    def error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    @property
+    def p95(self):
+        return percentile(list(self.latencies), 0.95)
+
+    def healthy(self):
+        return time.monotonic() >= self.cooldown_until
+
+    def summary(self):
+        p50 = percentile(list(self.latencies), 0.5)
+        return {
+            "requests": len(self.outcomes),
+            "error_rate": round(self.error_rate, 3),
+            "p50": round(p50, 3) if p50 is not None else None,
+            "p95": round(self.p95, 3) if self.p95 is not None else None,
+            "healthy": self.healthy(),
+        }
+
+
+async def _discard(task, iterator):
+    """Stop a request that lost the race and close its stream"""
+    task.cancel()
+    try:
+        await task
+    except BaseException:
+        pass
+    aclose = getattr(iterator, "aclose", None)
+    if aclose is not None:
+        try:
+            await aclose()
+        except Exception:
+            pass
+
+
+class WinnerMetrics:
+    """
+    Forwards the metrics_collected events of the provider requests whose results were used.
+
+    A provider reports its metrics by request id, sometimes before the
+    routed stream has passed that request's first result on, so events of
+    requests not known yet are held until accept() marks the request as
+    the winner. Those of requests that lost their race are never accepted
+    and fall out of the held ones.
+    """
+
+    def __init__(self, emit, kept=METRICS_REQUESTS_KEPT):
+        self._emit = emit
+        self._kept = kept
+        self._accepted = OrderedDict()
+        self._held = OrderedDict()
+
+    def collected(self, metrics):
+        request_id = getattr(metrics, "request_id", "")
+        if not request_id:
+            return
+        if request_id in self._accepted:
+            self._emit("metrics_collected", metrics)
+            return
+        self._held.setdefault(request_id, []).append(metrics)
+        while len(self._held) > self._kept:
+            self._held.popitem(last=False)
+
+    def accept(self, request_id):
+        if not request_id or request_id in self._accepted:
+            return
+        self._accepted[request_id] = True
+        while len(self._accepted) > self._kept:
+            self._accepted.popitem(last=False)
+        for metrics in self._held.pop(request_id, []):
+            self._emit("metrics_collected", metrics)
+
+
+class ProviderRouter:
+    """
+    Sends each request of one stage (stt, llm or tts) to the best of several providers.
+
+    Providers are tried in the configured order, skipping those in cooldown
+    after too many errors. When a provider has not produced its first result
+    within hedge_after seconds, the same request is also sent to the next
+    one and whichever answers first is used; a provider that fails before
+    answering is replaced by the next one right away. Once a stream has
+    started it is not switched, so the caller never hears two answers.
+    """
+
+    def __init__(self, stage, providers, hedge_after=None):
+        if not providers:
+            raise ValueError(f"No providers configured for {stage}")
+        self.stage = stage
+        self.providers = list(providers)
+        self.hedge_after = hedge_after
+        self.stats = {name: ProviderStats() for name, _ in self.providers}
+        # Losing requests are stopped in the background; their tasks are
+        # kept here until they finish so they aren't garbage collected
+        self._discards = set()
+
+    def order(self):
+        """Providers to try, healthy ones first, each group in the configured order"""
+        healthy = [(name, provider) for name, provider in self.providers if self.stats[name].healthy()]
+        return healthy + [(name, provider) for name, provider in self.providers if not self.stats[name].healthy()]
+
+    def _record(self, name, latency=None, error=False, outcome=None):
+        self.stats[name].record(latency, error)
+        metrics = get_metrics()
+        outcome = outcome or ("error" if error else "ok")
+        metrics.increment("provider_requests_total", stage=self.stage, provider=name, outcome=outcome)
+        if not error:
+            metrics.observe("provider_first_result_seconds", latency, stage=self.stage, provider=name)
+
+    def _discard_later(self, task, iterator):
+        discard = asyncio.ensure_future(_discard(task, iterator))
+        self._discards.add(discard)
+        discard.add_done_callback(self._discards.discard)
+
+    async def open(self, start):
+        """
+        Start a request and return (provider name, first item, iterator) of the provider answering first.
+
+        start(provider) must return an async iterator over the provider's
+        results. The first item is None if the winning stream was empty.
+        """
+        candidates = self.order()
+        pending = {}
+        last_error = None
+
+        def launch():
+            name, provider = candidates[len(launched)]
+            launched.append(name)
+            iterator = start(provider).__aiter__()
+            task = asyncio.ensure_future(iterator.__anext__())
+            pending[task] = (name, iterator, time.perf_counter())
+
+        launched = []
+        launch()
+        try:
+            while pending:
+                can_hedge = self.hedge_after and len(launched) < len(candidates)
+                done, _ = await asyncio.wait(
+                    pending, timeout=self.hedge_after if can_hedge else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    get_metrics().increment("provider_hedges_total", stage=self.stage)
+                    launch()
+                    continue
+
+                for task in done:
+                    name, iterator, started = pending.pop(task)
+                    try:
+                        first = task.result()
+                    except StopAsyncIteration:
+                        first = None
+                    except Exception as e:
+                        self._record(name, error=True)
+                        print(f"{self.stage} provider {name} failed: {e}")
+                        last_error = e
+                        if not pending and len(launched) < len(candidates):
+                            get_metrics().increment("provider_failovers_total", stage=self.stage)
+                            launch()
+                        continue
+
+                    self._record(name, time.perf_counter() - started)
+                    for other, (other_name, other_iterator, other_started) in list(pending.items()):
+                        # How long it had taken so far is a lower bound of its latency
+                        self._record(other_name, time.perf_counter() - other_started, outcome="lost")
+                        self._discard_later(other, other_iterator)
+                    pending.clear()
+                    return name, first, iterator
+        except BaseException:
+            for task, (_, iterator, _) in pending.items():
+                self._discard_later(task, iterator)
+            raise
+
+        raise APIConnectionError(f"All {self.stage} providers failed ({', '.join(launched)}): {last_error}")
+
+    async def stream(self, start):
+        """Yield the results of the provider answering first, see open()"""
+        name, first, iterator = await self.open(start)
+        if first is None:
+            return
+        yield first
+        try:
+            async for item in iterator:
+                yield item
+        except Exception:
+            # Too late to switch providers; count it against this one
+            self._record(name, error=True)
+            raise
+
+
+class RoutedLLM(llm.LLM):
+    """LLM that routes every chat request through a ProviderRouter of LLMs"""
+
+    def __init__(self, router):
+        super().__init__()
+        self.router = router
+        self._metrics = WinnerMetrics(self.emit)
+        for _, provider in router.providers:
+            provider.on("metrics_collected", self._metrics.collected)
+
+    @property
+    def model(self):
+        return self.router.order()[0][1].model
+
+    @property
+    def provider(self):
+        return self.router.order()[0][1].provider
+
+    def chat(self, *, chat_ctx, tools=None, conn_options=DEFAULT_API_CONNECT_OPTIONS,
+             parallel_tool_calls=NOT_GIVEN, tool_choice=NOT_GIVEN, extra_kwargs=NOT_GIVEN):
+        return RoutedLLMStream(
+            self, chat_ctx=chat_ctx, tools=tools or [], conn_options=conn_options,
+            options={"parallel_tool_calls": parallel_tool_calls, "tool_choice": tool_choice,
+                     "extra_kwargs": extra_kwargs},
+        )
+
+
+class RoutedLLMStream(llm.LLMStream):
+    def __init__(self, routed_llm, *, chat_ctx, tools, conn_options, options):
+        super().__init__(routed_llm, chat_ctx=chat_ctx, tools=tools, conn_options=conn_options)
+        self._options = options
+
+    def _start(self, provider):
+        async def chunks():
+            # Each provider gets a single attempt: the router retries elsewhere
+            async with provider.chat(
+                chat_ctx=self._chat_ctx, tools=self._tools,
+                conn_options=dataclasses.replace(self._conn_options, max_retry=0), **self._options,
+            ) as stream:
+                async for chunk in stream:
+                    yield chunk
+        return chunks()
+
+    async def _run(self):
+        async for chunk in self._llm.router.stream(self._start):
+            self._llm._metrics.accept(chunk.id)
+            self._event_ch.send_nowait(chunk)
+
+    async def _metrics_monitor_task(self, event_aiter):
+        # The winning provider's stream reports the metrics, forwarded by RoutedLLM
+        async for _ in event_aiter:
+            pass
+
+
+class RoutedSTT(stt.STT):
+    """Non-streaming STT that routes every recognition through a ProviderRouter of STTs"""
+
+    def __init__(self, router):
+        super().__init__(capabilities=stt.STTCapabilities(streaming=False, interim_results=False))
+        self.router = router
+
+    async def _recognize_impl(self, buffer, *, language=NOT_GIVEN, conn_options=DEFAULT_API_CONNECT_OPTIONS):
+        def start(provider):
+            async def result():
+                yield await provider.recognize(
+                    buffer, language=language, conn_options=dataclasses.replace(conn_options, max_retry=0)
+                )
+            return result()
+
+        _, event, _ = await self.router.open(start)
+        return event
+
+
+class RoutedTTS(tts.TTS):
+    """
+    TTS that routes every synthesis through a ProviderRouter of TTSs.
+
+    Text is synthesized a sentence at a time (the agent wraps non-streaming
+    TTS in a StreamAdapter), so a slow or failing provider only costs one
+    sentence. Audio from providers with another sample rate is resampled.
+    """
+
+    def __init__(self, router):
+        if len({provider.num_channels for _, provider in router.providers}) != 1:
+            raise ValueError("All TTS providers must have the same number of channels")
+        primary = router.providers[0][1]
+        super().__init__(
+            capabilities=tts.TTSCapabilities(streaming=False),
+            sample_rate=primary.sample_rate,
+            num_channels=primary.num_channels,
+        )
+        self.router = router
+        self._metrics = WinnerMetrics(self.emit)
+        for _, provider in router.providers:
+            provider.on("metrics_collected", self._metrics.collected)
+
+    def synthesize(self, text, *, conn_options=DEFAULT_API_CONNECT_OPTIONS):
+        return RoutedChunkedStream(tts=self, input_text=text, conn_options=conn_options)
+
+
+class RoutedChunkedStream(tts.ChunkedStream):
+    def _start(self, provider):
+        async def audios():
+            async with provider.synthesize(
+                self._input_text, conn_options=dataclasses.replace(self._conn_options, max_retry=0)
+            ) as stream:
+                async for audio in stream:
+                    yield audio
+        return audios()
+
+    async def _run(self, output_emitter):
+        output_emitter.initialize(
+            request_id=utils.shortuuid(),
+            sample_rate=self._tts.sample_rate,
+            num_channels=self._tts.num_channels,
+            mime_type="audio/pcm",
+        )
+
+        resampler = None
+        async for audio in self._tts.router.stream(self._start):
+            self._tts._metrics.accept(audio.request_id)
+            frame = audio.frame
+            if frame.sample_rate != self._tts.sample_rate and resampler is None:
+                resampler = rtc.AudioResampler(input_rate=frame.sample_rate, output_rate=self._tts.sample_rate)
+            for out in resampler.push(frame) if resampler is not None else [frame]:
+                output_emitter.push_frame(out)
+
+        if resampler is not None:
+            for out in resampler.flush():
+                output_emitter.push_frame(out)
+
+    async def _metrics_monitor_task(self, event_aiter):
+        # The winning provider's stream reports the metrics, forwarded by RoutedTTS
+        async for _ in event_aiter:
+            pass
+
+
+def stage_settings(stage, default_provider, default_hedge_after):
+    """
+    Return the provider names and hedging budget of a stage from the environment.
+
+    <STAGE>_PROVIDERS is a comma-separated list in order of preference and
+    <STAGE>_HEDGE_AFTER_SECONDS the budget for the first result before the
+    next provider is tried as well (0 only fails over on errors).
+    """
+    names = [name.strip() for name in os.environ.get(f"{stage.upper()}_PROVIDERS", default_provider).split(",")]
+    hedge_after = float(os.environ.get(f"{stage.upper()}_HEDGE_AFTER_SECONDS", str(default_hedge_after)))
+    return [name for name in names if name], hedge_after or None
+
+
+def routed(stage, factories, default_provider, default_hedge_after, wrapper):
+    """
+    Build the configured providers of a stage, wrapped in a router when there are several.
+
+    factories maps provider names to functions creating them; with a single
+    provider it is returned as is.
+    """
+    names, hedge_after = stage_settings(stage, default_provider, default_hedge_after)
+    unknown = [name for name in names if name not in factories]
+    if unknown:
+        raise ValueError(f"Unknown {stage} providers: {', '.join(unknown)}")
+
+    providers = [(name, factories[name]()) for name in names]
+    if len(providers) == 1:
+        return providers[0][1]
+    return wrapper(ProviderRouter(stage, providers, hedge_after))
+
+
+class StubProvider:
+    """
+    Local stand-in for a provider, to try out routing without network access.
+
+    Each request waits delay seconds (plus a spike of spike_delay seconds
+    with probability spike_rate) before its first result, then fails with
+    probability error_rate. answered and cancelled count the requests that
+    got their first result and those cancelled before it.
+    """
+
+    def __init__(self, name, delay=0.2, spike_rate=0.0, spike_delay=2.0, error_rate=0.0, seed=0):
+        self.name = name
+        self.delay = delay
+        self.spike_rate = spike_rate
+        self.spike_delay = spike_delay
+        self.error_rate = error_rate
+        self.answered = 0
+        self.cancelled = 0
+        self._random = random.Random(seed)
+
+    async def answer(self):
+        """Wait until the first result of a request is due, raising if the request fails"""
+        delay = self.delay + (self.spike_delay if self._random.random() < self.spike_rate else 0)
+        fails = self._random.random() < self.error_rate
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if fails:
+            raise APIConnectionError(f"{self.name} stub error")
+        self.answered += 1
+
+    async def stream(self, items=("hello", "world")):
+        await self.answer()
+        for item in items:
+            yield f"{self.name}:{item}"
+
+
+class StubLLM(llm.LLM):
+    """LLM answering "<name>:hello <name>:world" with the timing and errors of a StubProvider"""
+
+    def __init__(self, stub):
+        super().__init__()
+        self.stub = stub
+
+    @property
+    def model(self):
+        return self.stub.name
+
+    @property
+    def provider(self):
+        return "stub"
+
+    def chat(self, *, chat_ctx, tools=None, conn_options=DEFAULT_API_CONNECT_OPTIONS, **kwargs):
+        return StubLLMStream(self, chat_ctx=chat_ctx, tools=tools or [], conn_options=conn_options)
+
+
+class StubLLMStream(llm.LLMStream):
+    async def _run(self):
+        stub = self._llm.stub
+        await stub.answer()
+        for i, item in enumerate(("hello", "world")):
+            self._event_ch.send_nowait(llm.ChatChunk(
+                id=f"{stub.name}-{i}", delta=llm.ChoiceDelta(role="assistant", content=f"{stub.name}:{item} ")
+            ))
+
+
+class StubSTT(stt.STT):
+    """STT transcribing any audio as the name of its StubProvider"""
+
+    def __init__(self, stub):
+        super().__init__(capabilities=stt.STTCapabilities(streaming=False, interim_results=False))
+        self.stub = stub
+
+    async def _recognize_impl(self, buffer, *, language=NOT_GIVEN, conn_options=DEFAULT_API_CONNECT_OPTIONS):
+        await self.stub.answer()
+        return stt.SpeechEvent(
+            type=stt.SpeechEventType.FINAL_TRANSCRIPT,
+            alternatives=[stt.SpeechData(language="es", text=self.stub.name)],
+        )
+
+
+class StubTTS(tts.TTS):
+    """TTS synthesizing duration seconds of silence at sample_rate for any text"""
+
+    def __init__(self, stub, sample_rate=24000, duration=0.1):
+        super().__init__(capabilities=tts.TTSCapabilities(streaming=False), sample_rate=sample_rate, num_channels=1)
+        self.stub = stub
+        self.duration = duration
+
+    def synthesize(self, text, *, conn_options=DEFAULT_API_CONNECT_OPTIONS):
+        return StubChunkedStream(tts=self, input_text=text, conn_options=conn_options)
+
+
+class StubChunkedStream(tts.ChunkedStream):
+    async def _run(self, output_emitter):
+        output_emitter.initialize(
+            request_id=f"{self._tts.stub.name}-{utils.shortuuid()}",
+            sample_rate=self._tts.sample_rate,
+            num_channels=1,
+            mime_type="audio/pcm",
+        )
+        await self._tts.stub.answer()
+        output_emitter.push(b"\0\0" * int(self._tts.sample_rate * self._tts.duration))
+
+
+async def simulate(requests=200, hedge_after=0.05):
+    """
+    Compare the latency of a flaky primary alone against the primary hedged and backed by a secondary.
+
+    The primary answers in 20ms but spikes to 220ms on 10% of requests and
+    fails on 5%; the secondary always answers in 40ms.
+    """
+    def stubs():
+        return [("primary", StubProvider("primary", 0.02, spike_rate=0.1, spike_delay=0.2, error_rate=0.05, seed=1)),
+                ("secondary", StubProvider("secondary", 0.04, seed=2))]
+
+    results = {}
+    for label, router in (("primary only", ProviderRouter("stub", stubs()[:1])),
+                          ("hedged", ProviderRouter("stub", stubs(), hedge_after=hedge_after))):
+        latencies, errors, winners = [], 0, {}
+        for _ in range(requests):
+            started = time.perf_counter()
+            try:
+                name, _, _ = await router.open(lambda provider: provider.stream())
+            except APIConnectionError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            winners[name] = winners.get(name, 0) + 1
+
+        results[label] = {
+            "p50": round(percentile(latencies, 0.5), 3),
+            "p95": round(percentile(latencies, 0.95), 3),
+            "p99": round(percentile(latencies, 0.99), 3),
+            "errors": errors,
+            "answered_by": winners,
+            "providers": {name: stats.summary() for name, stats in router.stats.items()},
+        }
+    return results
+
+
+async def _llm_request(routed_llm):
+    async with routed_llm.chat(chat_ctx=llm.ChatContext.empty()) as stream:
+        return "".join([chunk.delta.content async for chunk in stream if chunk.delta])
+
+
+async def _stt_request(routed_stt):
+    event = await routed_stt.recognize(rtc.AudioFrame.create(16000, 1, 1600))
+    return event.alternatives[0].text
+
+
+async def _tts_request(routed_tts):
+    async with routed_tts.synthesize("hola") as stream:
+        frames = [audio.frame async for audio in stream]
+    if any(frame.sample_rate != routed_tts.sample_rate for frame in frames):
+        raise AssertionError(f"TTS audio was not resampled to {routed_tts.sample_rate} Hz")
+    return round(sum(frame.samples_per_channel for frame in frames) / routed_tts.sample_rate, 2)
+
+
+async def check_adapters(hedge_after=0.05):
+    """
+    Run RoutedLLM, RoutedSTT and RoutedTTS over stub providers and check how requests are routed.
+
+    For each adapter:
+    - hedge: a slow primary is hedged with a fast secondary, which answers,
+      and the primary's request is cancelled
+    - failover: a failing primary is replaced by the secondary right away
+    - cancel: cancelling a request while both providers are still working
+      cancels both
+
+    The LLM and TTS adapters must forward the metrics of the answering
+    provider only.
+
+    The TTS secondary runs at another sample rate, so its audio has to be
+    resampled. Raises AssertionError on the first check that fails; returns
+    what every check saw.
+    """
+    adapters = {
+        "llm": (lambda stub: StubLLM(stub), RoutedLLM, _llm_request),
+        "stt": (lambda stub: StubSTT(stub), RoutedSTT, _stt_request),
+        "tts": (lambda stub: StubTTS(stub, sample_rate=16000 if stub.name == "secondary" else 24000),
+                RoutedTTS, _tts_request),
+    }
+    scenarios = {
+        "hedge": (dict(delay=0.5), dict(delay=0.02), hedge_after),
+        "failover": (dict(delay=0.01, error_rate=1.0), dict(delay=0.02), None),
+        "cancel": (dict(delay=0.5), dict(delay=0.5), hedge_after),
+    }
+
+    results = {}
+    for adapter, (create, wrapper, request) in adapters.items():
+        for scenario, (primary_options, secondary_options, hedge) in scenarios.items():
+            primary = StubProvider("primary", **primary_options)
+            secondary = StubProvider("secondary", **secondary_options)
+            routed_adapter = wrapper(ProviderRouter(
+                f"stub-{adapter}", [(stub.name, create(stub)) for stub in (primary, secondary)], hedge_after=hedge
+            ))
+            forwarded = []
+            routed_adapter.on("metrics_collected", forwarded.append)
+
+            task = asyncio.ensure_future(request(routed_adapter))
+            if scenario == "cancel":
+                await asyncio.sleep(hedge_after * 3)
+                task.cancel()
+            try:
+                answer = await task
+            except asyncio.CancelledError:
+                answer = None
+            # Losing requests are cancelled in the background
+            await asyncio.sleep(0.1)
+
+            seen = {
+                "answer": answer,
+                "answered": {stub.name: stub.answered for stub in (primary, secondary)},
+                "cancelled": {stub.name: stub.cancelled for stub in (primary, secondary)},
+            }
+            expected = {
+                "hedge": {"answered": {"primary": 0, "secondary": 1}, "cancelled": {"primary": 1, "secondary": 0}},
+                "failover": {"answered": {"primary": 0, "secondary": 1}, "cancelled": {"primary": 0, "secondary": 0}},
+                "cancel": {"answered": {"primary": 0, "secondary": 0}, "cancelled": {"primary": 1, "secondary": 1}},
+            }[scenario]
+            if adapter != "stt":
+                # Stub request ids start with the provider's name
+                seen["metrics_from"] = sorted({metrics.request_id.split("-")[0] for metrics in forwarded})
+                expected["metrics_from"] = [] if scenario == "cancel" else ["secondary"]
+            for field, counts in expected.items():
+                if seen[field] != counts:
+                    raise AssertionError(f"{adapter} {scenario}: expected {field} {counts}, got {seen[field]}")
+            results[f"{adapter} {scenario}"] = seen
+    return results
+
+
+if __name__ == "__main__":
+    import json
+    import tempfile
+
+    # Keep the simulated requests out of the metrics served by the API
+    get_metrics().metrics_dir = tempfile.mkdtemp(prefix="provider_routing_")
+    print(json.dumps(asyncio.run(simulate()), indent=2))
+    print(json.dumps(asyncio.run(check_adapters()), indent=2))
@@ -0,0 +1,126 @@
+import asyncio
+import functools
+import os
+from collections import OrderedDict
+from dotenv import load_dotenv
+from clientLookup import format_matches, get_client_lookup, normalize, tokenize, uncovered_tokens
+from vectorIndex import DOC_TYPES
+
+load_dotenv(dotenv_path=".env.local")
+
+# Look callers up from what they just said, before the LLM asks for it
+SPECULATIVE_RETRIEVAL = os.environ.get("SPECULATIVE_RETRIEVAL", "true").lower() == "true"
+
+# Utterances with fewer words than this (after dropping filler words) can't
+# hold both a name and a company and are not looked up
+SPECULATIVE_MIN_TOKENS = int(os.environ.get("SPECULATIVE_RETRIEVAL_MIN_TOKENS", "2"))
+
+# Longest a query_info call waits, in total, for speculative lookups still
+# running before it searches itself. Lookups queued behind slow searches
+# aren't worth waiting for
+SPECULATIVE_WAIT_SECONDS = float(os.environ.get("SPECULATIVE_RETRIEVAL_WAIT_SECONDS", "0.5"))
+
+# Results kept per call
+SEARCH_MEMO_MAX_ENTRIES = int(os.environ.get("SEARCH_MEMO_MAX_ENTRIES", "64"))
+
+
+def search_key(query, top_k, doc_type=None, enterprise=None):
+    """Key of a query_info call: its words in any order and case, and its filters"""
+    return " ".join(sorted(set(tokenize(query)))), top_k, (doc_type or "").lower(), normalize(enterprise or "")
+
+
+def _client_tokens(client):
+    return set(tokenize(client["name"])), [set(tokenize(name)) for name in client["enterprise_names"]]
+
+
+class SearchMemo:
+    """
+    query_info results of one call, and client lookups started from what the caller said.
+
+    Results are kept by search_key, so the model re-validating a client or
+    asking the same thing again is answered without searching again. Each
+    entry is the future of the search, so a call made while the same search
+    is still running waits for it instead of starting another.
+
+    Speculative lookups run the client lookup on each transcribed caller
+    utterance as soon as it arrives. A later query_info call is answered
+    from one when all of its words were in the utterance, the clients found
+    have their whole name and a whole company name in the call's words, so
+    its own lookup would find the same clients, and the call asks for
+    nothing but those clients.
+    """
+
+    def __init__(self, executor, max_entries=SEARCH_MEMO_MAX_ENTRIES):
+        self.executor = executor
+        self.max_entries = max_entries
+        self._results = OrderedDict()
+        self._speculative = OrderedDict()
+
+    def get(self, key):
+        future = self._results.get(key)
+        if future is not None:
+            self._results.move_to_end(key)
+        return future
+
+    def put(self, key, future):
+        self._results[key] = future
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+
+    def discard(self, key, future):
+        """Forget a failed search, unless it was already replaced by another one"""
+        if self._results.get(key) is future:
+            del self._results[key]
+
+    def speculate(self, text, top_k=5):
+        """Start a client lookup for an utterance in the background"""
+        if not SPECULATIVE_RETRIEVAL:
+            return
+        tokens = frozenset(tokenize(text))
+        if len(tokens) < SPECULATIVE_MIN_TOKENS or tokens in self._speculative:
+            return
+
+        loop = asyncio.get_running_loop()
+        self._speculative[tokens] = loop.run_in_executor(
+            self.executor, functools.partial(get_client_lookup().search, text, limit=top_k)
+        )
+        while len(self._speculative) > self.max_entries:
+            self._speculative.popitem(last=False)
+
+    async def speculative_result(self, query, top_k, doc_type=None, enterprise=None, timeout=SPECULATIVE_WAIT_SECONDS):
+        """
+        Return the query_info result for a client search from a speculative lookup, or None.
+
+        Finished lookups are used right away; those still running are waited
+        for up to timeout seconds in total.
+        """
+        doc_types = [doc_type.lower()] if doc_type else [t.lower() for t in DOC_TYPES]
+        if doc_types and "client" not in doc_types:
+            return None
+
+        words = set(tokenize(f"{query} {enterprise}" if enterprise else query))
+        deadline = asyncio.get_running_loop().time() + timeout
+        for tokens, future in reversed(self._speculative.items()):
+            if not words or not words <= tokens:
+                continue
+            remaining = deadline - asyncio.get_running_loop().time()
+            if not future.done() and remaining <= 0:
+                continue
+            try:
+                matches = await asyncio.wait_for(asyncio.shield(future), max(remaining, 0))
+            except Exception:
+                continue
+
+            found = []
+            for score, client in matches:
+                name_tokens, enterprise_tokens = _client_tokens(client)
+                if name_tokens <= words and any(company and company <= words for company in enterprise_tokens):
+                    found.append((score, client))
+            if found:
+                if uncovered_tokens(" ".join(words), found):
+                    # The query asks for more than the client; search_knowledge_base
+                    # also searches the other documents for the rest
+                    return None
+                return f"SEARCH RESULTS:\n{format_matches(found[:top_k])}"
+        return None
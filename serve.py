@@ -0,0 +1,91 @@
+import os
+import sys
+from dotenv import load_dotenv
+
+load_dotenv(dotenv_path=".env.local")
+
+# Production server settings for the API. Each worker is a separate process
+# with its own threads, so a slow request only holds one thread of one worker.
+API_HOST = os.environ.get("API_HOST", "0.0.0.0")
+API_PORT = int(os.environ.get("API_PORT", "5555"))
+API_WORKERS = int(os.environ.get("API_WORKERS", str(min(4, (os.cpu_count() or 1) + 1))))
+API_THREADS = int(os.environ.get("API_THREADS", "8"))
+API_KEEPALIVE_SECONDS = int(os.environ.get("API_KEEPALIVE_SECONDS", "5"))
+API_TIMEOUT_SECONDS = int(os.environ.get("API_TIMEOUT_SECONDS", "180"))
+API_GRACEFUL_TIMEOUT_SECONDS = int(os.environ.get("API_GRACEFUL_TIMEOUT_SECONDS", "30"))
+
+# Restart workers after this many requests to bound memory growth; 0 (the
+# default) disables it. Index rebuilds and evaluation jobs run on thread
+# pools inside the workers, so a restarted worker fails the jobs it was
+# running, like any shutdown lasting longer than the graceful timeout
+API_MAX_REQUESTS = int(os.environ.get("API_MAX_REQUESTS", "0"))
+
+
+def gunicorn_options(host=API_HOST, port=API_PORT):
+    """Gunicorn settings built from the API_* environment variables"""
+    return {
+        "bind": f"{host}:{port}",
+        "workers": API_WORKERS,
+        "worker_class": "gthread",
+        "threads": API_THREADS,
+        "keepalive": API_KEEPALIVE_SECONDS,
+        "timeout": API_TIMEOUT_SECONDS,
+        "graceful_timeout": API_GRACEFUL_TIMEOUT_SECONDS,
+        "max_requests": API_MAX_REQUESTS,
+        "max_requests_jitter": API_MAX_REQUESTS // 10,
+        # Every worker imports the app itself, so thread pools, database
+        # engines and caches are never shared across a fork
+        "preload_app": False,
+        "accesslog": "-",
+    }
+
+
+def serve_gunicorn(host=API_HOST, port=API_PORT):
+    """Serve the API with gunicorn: API_WORKERS processes of API_THREADS threads each"""
+    from gunicorn.app.base import BaseApplication
+
+    class APIApplication(BaseApplication):
+        def load_config(self):
+            for key, value in gunicorn_options(host, port).items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from api import app
+            return app
+
+    APIApplication().run()
+
+
+def serve_waitress(host=API_HOST, port=API_PORT):
+    """
+    Serve the API with waitress, for Windows where gunicorn does not run.
+
+    Waitress runs a single process, so API_WORKERS is ignored and only
+    API_THREADS applies.
+    """
+    from waitress import serve
+    from api import app
+
+    print(f"API server started on http://{host}:{port} with {API_THREADS} threads")
+    serve(
+        app,
+        host=host,
+        port=port,
+        threads=API_THREADS,
+        channel_timeout=API_TIMEOUT_SECONDS,
+        connection_limit=API_THREADS * 10,
+    )
+
+
+def serve(host=API_HOST, port=API_PORT):
+    """Serve the API with a production WSGI server until it is stopped"""
+    if os.name == "nt":
+        serve_waitress(host, port)
+    else:
+        serve_gunicorn(host, port)
+
+
+if __name__ == "__main__":
+    # Gunicorn parses sys.argv itself; don't pass it ours
+    sys.argv = sys.argv[:1]
+    serve()
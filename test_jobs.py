@@ -0,0 +1,49 @@
+import tempfile
+import threading
+import time
+from jobs import JobRegistry
+
+
+class SlowSaveRegistry(JobRegistry):
+    """Registry whose state writes are slow, like a busy disk, to widen the window between workers"""
+
+    def save(self, state):
+        time.sleep(0.3)
+        super().save(state)
+
+
+def test_coalescing_across_registries():
+    """Two API workers sharing the jobs directory start a single rebuild between them"""
+    jobs_dir = tempfile.mkdtemp(prefix="jobs_")
+    registries = [SlowSaveRegistry(jobs_dir=jobs_dir), SlowSaveRegistry(jobs_dir=jobs_dir)]
+    runs = []
+    results = [None, None]
+
+    def rebuild(job):
+        runs.append(job.id)
+        time.sleep(1)
+
+    def submit(i):
+        results[i] = registries[i].submit("rebuild", rebuild, coalesce=True)
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(result["coalesced"] for result in results) == [False, True]
+    assert results[0]["job_id"] == results[1]["job_id"]
+
+    started = next(result for result in results if not result["coalesced"])
+    assert registries[0].wait(started["job_id"], timeout=10, interval=0.1)["status"] == "succeeded"
+    assert runs == [started["job_id"]]
+
+    # Once it finished, the next rebuild starts a new job
+    again = registries[1].submit("rebuild", rebuild, coalesce=True)
+    assert not again["coalesced"] and again["job_id"] != started["job_id"]
+
+
+if __name__ == "__main__":
+    test_coalescing_across_registries()
+    print("ok")
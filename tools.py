@@ -1,19 +1,50 @@
 from livekit.agents import function_tool, RunContext
-from llama_index.core import (
-    StorageContext,
-    load_index_from_storage,
-)
+import asyncio
+import functools
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional
 from dotenv import load_dotenv
-from openai import OpenAI
-from sqlalchemy import create_engine
-import pandas as pd
+from callRecords import format_timestamp, get_call_record_writer
+from metrics import get_metrics
+from searchMemo import SPECULATIVE_WAIT_SECONDS, SearchMemo, search_key
+from database import check_connection, connection_url, create_pooled_engine, get_engine
+from vectorIndex import search_knowledge_base
 
 load_dotenv(dotenv_path=".env.local")
 
 
+# Searches run on a bounded pool of threads so the blocking file and HTTP
+# work never stalls the event loop that handles audio for every session
+QUERY_TIMEOUT_SECONDS = float(os.environ.get("QUERY_INFO_TIMEOUT_SECONDS", "10"))
+QUERY_MAX_WORKERS = int(os.environ.get("QUERY_INFO_MAX_WORKERS", "4"))
+_query_executor = ThreadPoolExecutor(max_workers=QUERY_MAX_WORKERS, thread_name_prefix="query_info")
+
+
+def create_search_memo():
+    """Return a SearchMemo for a new call, searching on the query_info threads"""
+    return SearchMemo(_query_executor)
+
+
+def _search_memo(context):
+    """Return the SearchMemo of the agent session, or None when it has none"""
+    try:
+        userdata = context.userdata
+    except ValueError:
+        return None
+    return userdata if isinstance(userdata, SearchMemo) else None
+
+
 @function_tool
-async def query_info(context: RunContext, query: str, top_k: int) -> str:
+async def query_info(
+        context: RunContext,
+        query: str,
+        top_k: int,
+        doc_type: Optional[str] = None,
+        enterprise: Optional[str] = None,
+) -> str:
     """
     Search through documents using vector similarity to find clients, companies, or protocols.
 
@@ -21,92 +52,128 @@ async def query_info(context: RunContext, query: str, top_k: int) -> str:
         context: The runtime context
         query: The search query (client name and/or company name)
         top_k: Number of top results to consider
+        doc_type: Optional document type to search: "client", "company", "service" or "protocol"
+        enterprise: Optional company name to restrict the search to
     """
-    client = OpenAI()
-
     if top_k is None or top_k <= 0:
         top_k = 5
 
-    try:
-        if not os.path.exists("./vector_index"):
-            return "ERROR: Vector index not found."
-
-        # Make sure we're using the same embedding model that created the index
-        from llama_index.embeddings.openai import OpenAIEmbedding
-        embed_model = OpenAIEmbedding(model_name="text-embedding-ada-002")
-
-        storage_context = StorageContext.from_defaults(persist_dir="./vector_index")
-        index = load_index_from_storage(storage_context, embed_model=embed_model)
-
-        # Split name and company for better search
-        enhanced_query = f"""Find information about {query}. There are this posibilities, match with the client name, the enterprise name, 
-                            the service description or name if you find a match with the client name the enterprise name gave should match the one associated with the client provided must have."""
+    # Results already found in this call, either by an earlier identical
+    # query_info call or by a lookup started from what the caller said
+    memo = _search_memo(context)
+    key = search_key(query, top_k, doc_type, enterprise)
 
-        query_engine = index.as_query_engine(similarity_top_k=top_k)
-        response = query_engine.query(enhanced_query)
-
-        return f"SEARCH RESULTS:\n{str(response)}"
+    # One deadline covers the speculative lookups and the search itself
+    started = time.perf_counter()
+    deadline = started + QUERY_TIMEOUT_SECONDS
+    outcome = "ok"
+    future = None
+    try:
+        loop = asyncio.get_running_loop()
+        if memo is not None:
+            future = memo.get(key)
+            if future is not None:
+                outcome = "memoized"
+            else:
+                result = await memo.speculative_result(
+                    query, top_k, doc_type, enterprise, timeout=min(SPECULATIVE_WAIT_SECONDS, QUERY_TIMEOUT_SECONDS)
+                )
+                if result is not None:
+                    outcome = "speculative"
+                    return result
+
+        if future is None:
+            future = loop.run_in_executor(_query_executor, functools.partial(
+                search_knowledge_base,
+                query,
+                top_k,
+                doc_types=[doc_type] if doc_type else None,
+                enterprise=enterprise,
+            ))
+            if memo is not None:
+                memo.put(key, future)
+
+        # If the caller interrupts, the tool call is cancelled and stops
+        # waiting here; the search finishes in the background and stays
+        # memoized for the next call
+        result = await asyncio.wait_for(asyncio.shield(future), timeout=max(deadline - time.perf_counter(), 0))
+        if result.startswith("ERROR:") and memo is not None:
+            memo.discard(key, future)
+        return result
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        return "ERROR: The search took too long, please try again."
     except Exception as e:
+        outcome = "error"
+        if memo is not None and future is not None:
+            memo.discard(key, future)
         return f"ERROR: {str(e)}"
+    finally:
+        get_metrics().observe("query_info_seconds", time.perf_counter() - started, outcome=outcome)
+
+_connection_checked = False
 
-def save_transcript_database(filepath: str, room_name: str):
-    engine = create_database_connection()
 
-    if engine is None:
-        print("Failed to connect to the database. Transcript not saved.")
-        return
+def save_transcript_database(filepath: str, room_name: str, started_at=None, ended_at=None):
+    """
+    Queue the record of a finished call to be saved to the Calls table.
+
+    The record is spooled locally and written in a batch by the call record
+    writer, so this returns without waiting on the database. started_at and
+    ended_at are the datetimes the call began and ended, defaulting to now.
+    """
+    ended_at = ended_at or datetime.now()
+    started_at = started_at or ended_at
 
     try:
-        with engine.connect() as connection:
-            from sqlalchemy import text
-            query = text(""" INSERT INTO Calls (CodigoLlamada, HoraInicio, HoraFin, Grabacion) 
-            VALUES (:room_name, NOW(), NOW(), :filepath)
-            """)
-            connection.execute(query, {
-                "room_name": room_name,
-                "filepath": filepath,
-            })
-            connection.commit()
-        print(f"Transcript saved to database.")
+        get_call_record_writer().submit({
+            "room_name": room_name,
+            "started_at": format_timestamp(started_at),
+            "ended_at": format_timestamp(ended_at),
+            "filepath": filepath,
+        })
+        print(f"Transcript queued to be saved to database.")
     except Exception as e:
         print(f"Error saving transcript to database: {e}")
 
 
-
 def create_database_connection(
         host=None, port=None, user=None, password=None, db_name=None, test_connection=True
 ):
     """
-    Create and return a SQLAlchemy database engine connection.
+    Return a SQLAlchemy database engine.
+
+    Without connection arguments this is the pooled engine shared by the
+    whole process, and the connection is only tested on the first call.
 
     Args:
-        host: Database host (defaults to DB_HOST env variable)
-        port: Database port (defaults to DB_PORT env variable)
-        user: Database user (defaults to DB_USER env variable)
-        password: Database password (defaults to DB_PASSWORD env variable)
-        db_name: Database name (defaults to DB_NAME env variable)
+        host: Database host (defaults to MYSQL_HOST env variable)
+        port: Database port (defaults to MYSQL_PORT env variable)
+        user: Database user (defaults to MYSQL_USER env variable)
+        password: Database password (defaults to MYSQL_PASSWORD env variable)
+        db_name: Database name (defaults to MYSQL_DATABASE env variable)
         test_connection: Whether to test the connection
 
     Returns:
         SQLAlchemy engine if successful, None if connection fails
     """
-    print("Connecting to database...")
-    host = host or os.environ.get("MYSQL_HOST")
-    port = port or os.environ.get("MYSQL_PORT")
-    user = user or os.environ.get("MYSQL_USER")
-    password = password or os.environ.get("MYSQL_PASSWORD")
-    db_name = db_name or os.environ.get("MYSQL_DATABASE")
-
-    connection_string = f"mysql+pymysql://{user}:{password}@{host}:{port}/{db_name}"
-    engine = create_engine(connection_string)
-
-    if test_connection:
-        try:
-            tables = pd.read_sql("SHOW TABLES", engine)
-            print("Database connection successful!")
-            return engine
-        except Exception as e:
-            print(f"Error connecting to database: {e}")
+    global _connection_checked
+
+    if any((host, port, user, password, db_name)):
+        engine = create_pooled_engine(connection_url(host, port, user, password, db_name))
+        if test_connection and not check_connection(engine):
+            return None
+        return engine
+
+    engine = get_engine()
+    if test_connection and not _connection_checked:
+        print("Connecting to database...")
+        if not check_connection(engine):
             return None
+        print("Database connection successful!")
+        _connection_checked = True
 
-    return engine
\ No newline at end of file
+    return engine
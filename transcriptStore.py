@@ -0,0 +1,71 @@
+import gzip
+import json
+import os
+import re
+import uuid
+from datetime import datetime
+from dotenv import load_dotenv
+
+load_dotenv(dotenv_path=".env.local")
+
+# Transcripts are stored as TRANSCRIPTS_DIR/YYYY/MM/DD/<room>/<room>_<time>_<id>.json.gz
+TRANSCRIPTS_DIR = os.environ.get("TRANSCRIPTS_DIR", "./transcripts")
+COMPRESS_LEVEL = int(os.environ.get("TRANSCRIPT_COMPRESS_LEVEL", "6"))
+
+SUFFIX = ".json.gz"
+
+
+def _safe_name(room_name):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", str(room_name)).strip("._")[:100] or "room"
+
+
+def transcript_path(room_name, when=None, transcripts_dir=TRANSCRIPTS_DIR):
+    """
+    Return a new, unique path for the transcript of a call in room_name that ended at when.
+
+    Transcripts are partitioned by day and room, so no directory grows with
+    the total number of calls, and the random id keeps concurrent calls in
+    the same room and second apart.
+    """
+    when = when or datetime.now()
+    room = _safe_name(room_name)
+    return os.path.join(
+        transcripts_dir,
+        when.strftime("%Y"), when.strftime("%m"), when.strftime("%d"),
+        room,
+        f"{room}_{when.strftime('%H-%M-%S')}_{uuid.uuid4().hex[:12]}{SUFFIX}",
+    )
+
+
+def write_transcript(history, room_name, when=None, transcripts_dir=TRANSCRIPTS_DIR):
+    """
+    Write a call transcript as compact, gzip-compressed JSON and return its path.
+
+    The file is written under a temporary name and renamed, so readers never
+    see a partial transcript.
+    """
+    path = transcript_path(room_name, when, transcripts_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    data = json.dumps(history, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(gzip.compress(data, compresslevel=COMPRESS_LEVEL))
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_transcript(path):
+    """
+    Read a transcript written by write_transcript.
+
+    Plain JSON transcripts written before compression was introduced are
+    read as well.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    # Gzip streams start with the bytes 1f 8b
+    if data[:2] == b"\x1f\x8b":
+        data = gzip.decompress(data)
+    return json.loads(data.decode("utf-8"))
@@ -1,43 +1,108 @@
+import hashlib
 import json
 import os
+import sys
 import pandas as pd
-from sqlalchemy import create_engine
-from llama_index.core import SimpleDirectoryReader, VectorStoreIndex
+from sqlalchemy import text
+from llama_index.core import Document, Settings, StorageContext, VectorStoreIndex, load_index_from_storage
+from llama_index.core.ingestion import run_transformations
 from dotenv import load_dotenv
+from database import check_connection, get_engine
+from embeddingCache import with_cache
+from embeddingPipeline import EMBED_BATCH_SIZE, embed_nodes, get_local_embedding_pool
+from vectorIndex import document_metadata
+from annVectorStore import create_vector_store, load_vector_store, remove_vector_store_files
+from knowledgeBase import EXPORT_FORMAT, open_writer, read_records
+from indexVersions import (INDEX_DIR, create_staging_dir, current_version, discard_staging_dir, promote,
+                           resolve_index_dir)
 
 load_dotenv(dotenv_path=".env.local")
 
-def export_db_to_files(db_connection, export_dir="vectordb/knowledge_base"):
-    """Export database tables to files for vector storage"""
-
-    os.makedirs(export_dir, exist_ok=True)
-    file_paths = []
-
-    # Export enterprises
-    try:
-        enterprises_df = pd.read_sql("SELECT * FROM Companies", db_connection)
-
-        for i, enterprise in enterprises_df.iterrows():
-            enterprise_doc = {
-                "enterprise_id": str(enterprise["Codigo"]),
-                "name": enterprise["Nombre"],
-                "type": "Company",
-                "phoneNumber": enterprise.get("Telefono", ""),
-                "email": enterprise.get("Email", ""),
-                "city": enterprise.get("Ciudad", ""),
-                "address": enterprise.get("Direccion", "")
-            }
-
-            file_path = f"{export_dir}/enterprise_{enterprise['Id']}.json"
-            with open(file_path, "w") as f:
-                json.dump(enterprise_doc, f, indent=2)
-            file_paths.append(file_path)
-    except Exception as e:
-        print(f"Error exporting enterprises: {e}")
-
-    # Export clients
-    try:
-        clients_df = pd.read_sql("""
+# Content hashes of the indexed documents, stored next to the index files
+MANIFEST_FILE = "manifest.json"
+
+# Rows read from the database at a time, and documents embedded and
+# inserted into the index at a time
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", "5000"))
+INDEX_BATCH_SIZE = int(os.environ.get("INDEX_BATCH_SIZE", "1000"))
+
+# Record id prefixes written by each section of the export
+ENTERPRISE_PREFIXES = ("enterprise_",)
+CLIENT_PREFIXES = ("client_", "clients_enterprise_")
+SERVICE_PREFIXES = ("services_enterprise_",)
+PROTOCOL_PREFIXES = ("protocol_",)
+
+
+def _after_clause(columns):
+    """SQL condition selecting the rows that sort after :after_0, :after_1... on the given columns"""
+    terms = []
+    for i, column in enumerate(columns):
+        equal = [f"{previous} = :after_{j}" for j, previous in enumerate(columns[:i])]
+        terms.append("(" + " AND ".join(equal + [f"{column} > :after_{i}"]) + ")")
+    return " OR ".join(terms)
+
+
+def read_sql_chunks(sql, db_connection, keys, chunksize=EXPORT_CHUNK_SIZE):
+    """
+    Yield the result of a query as DataFrames of at most chunksize rows.
+
+    Each chunk is read by its own query, paginated on the query's sort key,
+    so no cursor stays open while the caller works on a chunk (MySQL aborts
+    a result set left unread for longer than net_write_timeout). sql must
+    have an {after} placeholder in its WHERE clause, order its rows by the
+    key and end in "LIMIT :limit". keys is a list of (SQL column, result
+    column) pairs forming a unique sort key.
+    """
+    columns = [column for column, _ in keys]
+    params = {"limit": chunksize}
+    after = "1 = 1"
+    while True:
+        with db_connection.connect() as connection:
+            chunk = pd.read_sql(text(sql.format(after=after)), connection, params=params)
+        if chunk.empty:
+            return
+        yield chunk
+        if len(chunk) < chunksize:
+            return
+
+        # to_dict gives Python values, which the driver can bind
+        last = chunk[[name for _, name in keys]].tail(1).to_dict("records")[0]
+        params = {"limit": chunksize, **{f"after_{i}": last[name] for i, (_, name) in enumerate(keys)}}
+        after = _after_clause(columns)
+
+
+def _column(df, name, default=""):
+    """Return a column of the table, or the default for every row if the table doesn't have it"""
+    if name in df.columns:
+        return df[name]
+    return pd.Series(default, index=df.index, dtype=object)
+
+
+def _json_records(ids, docs_df):
+    for doc_id, doc in zip(ids, docs_df.to_dict("records")):
+        yield {"id": doc_id, "text": json.dumps(doc, indent=2, default=str)}
+
+
+def export_enterprise_records(db_connection):
+    enterprises_chunks = read_sql_chunks(
+        "SELECT * FROM Companies WHERE {after} ORDER BY Id LIMIT :limit", db_connection, [("Id", "Id")]
+    )
+    for enterprises_df in enterprises_chunks:
+        docs_df = pd.DataFrame({
+            "enterprise_id": enterprises_df["Codigo"].astype(str),
+            "name": enterprises_df["Nombre"],
+            "type": "Company",
+            "phoneNumber": _column(enterprises_df, "Telefono"),
+            "email": _column(enterprises_df, "Email"),
+            "city": _column(enterprises_df, "Ciudad"),
+            "address": _column(enterprises_df, "Direccion"),
+        })
+        ids = "enterprise_" + enterprises_df["Id"].astype(str) + ".json"
+        yield from _json_records(ids, docs_df)
+
+
+def export_client_records(db_connection):
+    clients_chunks = read_sql_chunks("""
 SELECT 
     c.*,
     GROUP_CONCAT(e.Nombre SEPARATOR ', ') as enterprise_names,
@@ -46,112 +111,74 @@ FROM
     Clients c
     JOIN ClientCompanies cc ON c.Id = cc.ClienteId
     JOIN Companies e ON e.Id = cc.EmpresaId
+WHERE {after}
 GROUP BY 
     c.CodigoCliente, c.Id, c.NombreCompleto
-                                 """, db_connection)
-        print(f"Exported {len(clients_df)} clients")
-
-        # Optional: If too many clients, group by enterprise
-        if len(clients_df) > 1000:
-            # Group clients by enterprise
-            for enterprise_id, group in clients_df.groupby("enterprise_id"):
-                clients_list = []
-                for _, client in group.iterrows():
-                    clients_list.append({
-                        "client_id": str(client["Id"]),
-                        "name": client["NombreCompleto"],
-                        "type": "client",
-                        "carnetIdentidad": client.get("Ci", ""),
-                        "email": client.get("Email", ""),
-                        "phoneNumber": client.get("NumeroTelf", ""),
-                        "address": client.get("Direccion", "")
-                    })
-
-                # Save as one file per enterprise
-                file_path = f"{export_dir}/clients_enterprise_{enterprise_id}.json"
-                with open(file_path, "w") as f:
-                    json.dump({
-                        "enterprise_ids": str(enterprise_id),
-                        "enterprises_names": group.iloc[0]["enterprise_name"],
-                        "clients": clients_list
-                    }, f, indent=2)
-                file_paths.append(file_path)
-        else:
-            # Individual client files
-            for i, client in clients_df.iterrows():
-                client_doc = {
-                    "client_id": str(client["Id"]),
-                    "name": client["NombreCompleto"],
-                    "enterprise_id": str(client["enterprise_ids"]),
-                    "enterprise_name": client["enterprise_names"],
-                    "type": "client",
-                    "carnetIdentidad": client.get("Ci", ""),
-                    "email": client.get("Email", ""),
-                    "phoneNumber": client.get("NumeroTelf", ""),
-                    "address": client.get("Direccion", "")
-                }
-
-                file_path = f"{export_dir}/client_{client['Id']}.json"
-                with open(file_path, "w") as f:
-                    json.dump(client_doc, f, indent=2)
-                file_paths.append(file_path)
-    except Exception as e:
-        print(f"Error exporting clients: {e}")
-
-    # Export services
-    try:
-        services_df = pd.read_sql("""
-                                  SELECT s.*, e.Nombre as enterprise_name, e.Id as enterprise_id
-                                  FROM Services s
-                                           JOIN Companies e ON s.CompanyId = e.id
-                                  """, db_connection)
-        print(f"Exported {len(services_df)} services")
-
-        # Group services by enterprise
-        for enterprise_id, group in services_df.groupby("enterprise_id"):
-            services_list = []
-            for _, service in group.iterrows():
-                services_list.append({
-                    "service_id": str(service["Id"]),
-                    "name": service["NombreServicio"],
-                    "description": service.get("Descripcion", ""),
-                    "type": "service"
-                })
-
-            # Save as one file per enterprise
-            file_path = f"{export_dir}/services_enterprise_{enterprise_id}.json"
-            with open(file_path, "w") as f:
-                json.dump({
-                    "enterprise_id": str(enterprise_id),
-                    "enterprise_name": group.iloc[0]["enterprise_name"],
-                    "services": services_list
-                }, f, indent=2)
-            file_paths.append(file_path)
-    except Exception as e:
-        print(f"Error exporting services: {e}")
-
-    # Export protocols
-    try:
-        protocols_df = pd.read_sql("""SELECT P.Id,
-                                             P.NombreProtocolo,
-                                             P.Descripcion,
-                                             R.CodigoMotivo,
-                                             R.NombreMotivo                                         as reason_name,
-                                             R.Descripcion                                          as reason_description,
-                                             R.Id                                                   as reason_id,
-                                             GROUP_CONCAT(CONCAT(PS.CodigoPasoProtocolo, '. ', PS.PasoProtocolo) ORDER
-                                                          BY PS.CodigoPasoProtocolo SEPARATOR '\n') as steps
-                                      FROM Protocols P
-                                               JOIN Reasons R ON P.ReasonId = R.Id
-                                               LEFT JOIN ProtocolSteps PS ON P.Id = PS.ProtocolId
-                                      GROUP BY P.Id, P.NombreProtocolo, P.Descripcion, R.CodigoMotivo, R.NombreMotivo,
-                                               R.Descripcion, R.Id
-                                   """, db_connection)
-        print(f"Exported {len(protocols_df)} protocols")
-
-        for i, protocol in protocols_df.iterrows():
-            # Create markdown content for each protocol
-            protocol_content = f"""# {protocol['NombreProtocolo']}
+ORDER BY c.Id
+LIMIT :limit
+                                 """, db_connection, [("c.Id", "Id")])
+
+    for clients_df in clients_chunks:
+        docs_df = pd.DataFrame({
+            "client_id": clients_df["Id"].astype(str),
+            "name": clients_df["NombreCompleto"],
+            "enterprise_id": clients_df["enterprise_ids"].astype(str),
+            "enterprise_name": clients_df["enterprise_names"],
+            "type": "client",
+            "carnetIdentidad": _column(clients_df, "Ci"),
+            "email": _column(clients_df, "Email"),
+            "phoneNumber": _column(clients_df, "NumeroTelf"),
+            "address": _column(clients_df, "Direccion"),
+        })
+        ids = "client_" + clients_df["Id"].astype(str) + ".json"
+        yield from _json_records(ids, docs_df)
+
+
+def _services_record(enterprise_id, group):
+    return {
+        "id": f"services_enterprise_{enterprise_id}.json",
+        "text": json.dumps({
+            "enterprise_id": str(enterprise_id),
+            "enterprise_name": group["enterprise_name"].iloc[0],
+            "services": group[["service_id", "name", "description", "type"]].to_dict("records"),
+        }, indent=2, default=str),
+    }
+
+
+def export_service_records(db_connection):
+    services_chunks = read_sql_chunks("""
+                              SELECT s.*, e.Nombre as enterprise_name, e.Id as enterprise_id
+                              FROM Services s
+                                       JOIN Companies e ON s.CompanyId = e.id
+                              WHERE {after}
+                              ORDER BY e.Id, s.Id
+                              LIMIT :limit
+                              """, db_connection, [("e.Id", "enterprise_id"), ("s.Id", "Id")])
+
+    # Group services by enterprise. Rows arrive ordered by enterprise, so
+    # only the last group of a chunk can continue into the next one.
+    pending = None
+    for services_df in services_chunks:
+        services_df = services_df.assign(
+            service_id=services_df["Id"].astype(str),
+            name=services_df["NombreServicio"],
+            description=_column(services_df, "Descripcion"),
+            type="service",
+        )
+        if pending is not None:
+            services_df = pd.concat([pending, services_df], ignore_index=True)
+
+        groups = list(services_df.groupby("enterprise_id", sort=False))
+        for enterprise_id, group in groups[:-1]:
+            yield _services_record(enterprise_id, group)
+        pending = groups[-1][1] if groups else None
+
+    if pending is not None:
+        yield _services_record(pending["enterprise_id"].iloc[0], pending)
+
+
+def _protocol_markdown(protocol):
+    return f"""# {protocol['NombreProtocolo']}
 ## protocol_id: {protocol['Id']}
 
 ## Description
@@ -170,84 +197,331 @@ GROUP BY
 {protocol.get('notes', '')}
 """
 
-            # Save as markdown file
-            file_path = f"{export_dir}/protocol_{protocol['Id']}.md"
-            with open(file_path, "w") as f:
-                f.write(protocol_content)
-            file_paths.append(file_path)
-    except Exception as e:
-        print(f"Error exporting protocols: {e}")
 
-    print(f"Successfully exported {len(file_paths)} files to {export_dir}/")
-    return file_paths
+def export_protocol_records(db_connection):
+    protocols_chunks = read_sql_chunks("""SELECT P.Id,
+                                         P.NombreProtocolo,
+                                         P.Descripcion,
+                                         R.CodigoMotivo,
+                                         R.NombreMotivo                                         as reason_name,
+                                         R.Descripcion                                          as reason_description,
+                                         R.Id                                                   as reason_id,
+                                         GROUP_CONCAT(CONCAT(PS.CodigoPasoProtocolo, '. ', PS.PasoProtocolo) ORDER
+                                                      BY PS.CodigoPasoProtocolo SEPARATOR '\n') as steps
+                                  FROM Protocols P
+                                           JOIN Reasons R ON P.ReasonId = R.Id
+                                           LEFT JOIN ProtocolSteps PS ON P.Id = PS.ProtocolId
+                                  WHERE {after}
+                                  GROUP BY P.Id, P.NombreProtocolo, P.Descripcion, R.CodigoMotivo, R.NombreMotivo,
+                                           R.Descripcion, R.Id
+                                  ORDER BY P.Id
+                                  LIMIT :limit
+                               """, db_connection, [("P.Id", "Id")])
+
+    # Create markdown content for each protocol
+    for protocols_df in protocols_chunks:
+        for protocol in protocols_df.to_dict("records"):
+            yield {"id": f"protocol_{protocol['Id']}.md", "text": _protocol_markdown(protocol)}
+
+
+# Export sections with the record id prefixes each one produces
+EXPORT_SECTIONS = (
+    ("enterprises", ENTERPRISE_PREFIXES, export_enterprise_records),
+    ("clients", CLIENT_PREFIXES, export_client_records),
+    ("services", SERVICE_PREFIXES, export_service_records),
+    ("protocols", PROTOCOL_PREFIXES, export_protocol_records),
+)
+RECORD_PREFIXES = tuple(prefix for _, prefixes, _ in EXPORT_SECTIONS for prefix in prefixes)
+
+
+def export_db_records(db_connection, export_dir="vectordb/knowledge_base"):
+    """
+    Yield export records of {"id": document name, "text": content} for every table.
+
+    Records are produced chunk by chunk as rows stream in from the database.
+    A section that fails to export yields its remaining records from the
+    previous export in export_dir, so a transient error doesn't delete its
+    documents from the index.
+    """
+    for name, prefixes, export_section in EXPORT_SECTIONS:
+        exported = set()
+        try:
+            for record in export_section(db_connection):
+                exported.add(record["id"])
+                yield record
+            print(f"Exported {len(exported)} {name}")
+        except Exception as e:
+            print(f"Error exporting {name}: {e}")
+            for record in read_records(export_dir):
+                if record["id"].startswith(prefixes) and record["id"] not in exported:
+                    yield record
+
+
+def stream_export(db_connection, export_dir="vectordb/knowledge_base", export_format=EXPORT_FORMAT):
+    """
+    Export database tables to export_dir, yielding each record as it is written.
+
+    The new export only replaces the previous one once every record has been
+    consumed; if the consumer stops early the previous export is kept.
+    """
+    writer = open_writer(export_dir, export_format, RECORD_PREFIXES)
+    try:
+        for record in export_db_records(db_connection, export_dir):
+            writer.write(record)
+            yield record
+        writer.commit()
+        print(f"Successfully exported {writer.count} records to {export_dir}/")
+    finally:
+        writer.close()
+
 
+def export_db_to_files(db_connection, export_dir="vectordb/knowledge_base", export_format=EXPORT_FORMAT):
+    """
+    Export database tables to files for vector storage.
+
+    The "jsonl" format writes a few shard files; "files" writes one file per
+    record. Returns the number of exported records.
+    """
+    return sum(1 for _ in stream_export(db_connection, export_dir, export_format))
 
-def build_vector_index(data_dir="vectordb/knowledge_base", index_dir="./vector_index"):
-    """Build a vector index from the exported files"""
-    os.makedirs(index_dir, exist_ok=True)
 
-    print(f"Building vector index from {data_dir}")
-    documents = SimpleDirectoryReader(data_dir).load_data()
-    print(f"Loaded {len(documents)} documents")
+def records_to_documents(records):
+    """
+    Turn export records into documents keyed by record id, one at a time.
 
-    # Explicitly set OpenAI API key for embeddings
+    Stable ids let later updates replace or delete the nodes of a single
+    document in the index. Each document carries its type and identifiers
+    as metadata so searches can be restricted by type and enterprise; the
+    metadata is left out of the embedded text, which already contains it.
+    """
+    for record in records:
+        metadata = {"file_name": record["id"], **document_metadata(record["id"], record["text"])}
+        yield Document(
+            id_=record["id"],
+            text=record["text"],
+            metadata=metadata,
+            excluded_embed_metadata_keys=list(metadata),
+            excluded_llm_metadata_keys=list(metadata),
+        )
+
+
+def load_documents(data_dir="vectordb/knowledge_base"):
+    """Load the exported records of a knowledge base directory as documents"""
+    return list(records_to_documents(read_records(data_dir)))
+
+
+def document_hash(document):
+    return hashlib.sha256(document.text.encode("utf-8")).hexdigest()
+
+
+def load_manifest(index_dir="./vector_index"):
+    """Return the {document id: content hash} manifest of the index, or None if there is none"""
+    manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+
+    with open(manifest_path, "r") as f:
+        return json.load(f).get("documents", {})
+
+
+def save_manifest(documents, index_dir="./vector_index"):
+    manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+    with open(manifest_path, "w") as f:
+        json.dump({"documents": documents}, f, indent=2)
+
+
+def get_embed_model():
+    """Return the embedding model used to build the index, backed by the embedding cache"""
     from llama_index.embeddings.openai import OpenAIEmbedding
     import openai
 
     # Get API key from environment (which should be loaded from .env.local)
-    os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
     openai_api_key = os.getenv("OPENAI_API_KEY")
 
     if openai_api_key:
         print("Using OpenAI embeddings")
         openai.api_key = openai_api_key
-        embed_model = OpenAIEmbedding(api_key=openai_api_key)
-    else:
-        # Fallback to local embeddings if no API key available
-        print("OpenAI API key not found, using local embeddings instead")
-        from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-        embed_model = HuggingFaceEmbedding(model_name="BAAI/bge-small-en-v1.5")
-        # Make sure to install: pip install llama-index-embeddings-huggingface transformers sentence-transformers
-
-    index = VectorStoreIndex.from_documents(
-        documents,
-        embed_model=embed_model
-    )
+        # Retries are left to embed_nodes, which also backs off its concurrency on rate limits
+        return with_cache(OpenAIEmbedding(api_key=openai_api_key, embed_batch_size=EMBED_BATCH_SIZE, max_retries=0))
+
+    # Fallback to local embeddings if no API key available
+    print("OpenAI API key not found, using local embeddings instead")
+    # Make sure to install: pip install llama-index-embeddings-huggingface transformers sentence-transformers
+    return with_cache(get_local_embedding_pool("BAAI/bge-small-en-v1.5"))
+
+
+def _insert_batch(index, documents, manifest, embed_model):
+    """Replace the previous version of each document in the index with the new one"""
+    # Embed before touching the index, so a failed batch leaves it unchanged
+    nodes = embed_nodes(run_transformations(documents, Settings.transformations), embed_model)
+
+    for document in documents:
+        if document.id_ in manifest:
+            index.delete_ref_doc(document.id_, delete_from_docstore=True)
+
+    index.insert_nodes(nodes)
+    for document in documents:
+        index.docstore.set_document_hash(document.id_, document.hash)
+
+
+def index_documents(index, documents, manifest, embed_model, batch_size=INDEX_BATCH_SIZE, progress=None):
+    """
+    Insert the new and changed documents of a stream into the index, batch_size at a time.
+
+    The nodes of each batch are embedded in concurrent requests by
+    embed_nodes. Embeddings are stored in the embedding cache as each
+    request completes, so an interrupted rebuild picks up where it stopped
+    without embedding those documents again.
+
+    progress, when given, is called as progress(seen, embedded) every
+    batch_size documents. Returns the {document id: content hash} of every
+    document seen and the number of documents that were embedded.
+    """
+    hashes = {}
+    batch = []
+    embedded = 0
+
+    for document in documents:
+        hashes[document.id_] = document_hash(document)
+        if progress is not None and len(hashes) % batch_size == 0:
+            progress(len(hashes), embedded)
+        if manifest.get(document.id_) == hashes[document.id_]:
+            continue
+
+        batch.append(document)
+        if len(batch) >= batch_size:
+            _insert_batch(index, batch, manifest, embed_model)
+            embedded += len(batch)
+            batch = []
+            print(f"Indexed {embedded} documents so far")
+
+    if batch:
+        _insert_batch(index, batch, manifest, embed_model)
+        embedded += len(batch)
+
+    if progress is not None:
+        progress(len(hashes), embedded)
+    return hashes, embedded
+
+
+def build_vector_index(data_dir="vectordb/knowledge_base", index_dir="./vector_index", backend=None, documents=None,
+                       progress=None, embed_model=None):
+    """
+    Build a vector index from the exported files, or from documents when given.
+
+    documents may be any iterable, such as the stream from stream_export;
+    they are embedded and inserted in batches. backend selects the vector
+    store ("simple" or "ann"), defaulting to the VECTOR_STORE_BACKEND setting,
+    and embed_model defaults to get_embed_model().
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    remove_vector_store_files(index_dir)
+
+    if documents is None:
+        print(f"Building vector index from {data_dir}")
+        documents = records_to_documents(read_records(data_dir))
+
+    embed_model = embed_model or get_embed_model()
+    storage_context = StorageContext.from_defaults(vector_store=create_vector_store(backend))
+    index = VectorStoreIndex(nodes=[], storage_context=storage_context, embed_model=embed_model)
+    hashes, embedded = index_documents(index, documents, {}, embed_model, progress=progress)
+    print(f"Loaded {embedded} documents")
 
     index.storage_context.persist(index_dir)
+    save_manifest(hashes, index_dir)
     print(f"Vector index built and saved to {index_dir}")
 
     return index
 
 
-def main():
-    # Database connection setup
-    print("Connecting to database...")
-    DB_HOST = os.environ.get("MYSQL_HOST")
-    DB_PORT = os.environ.get("MYSQL_PORT") or "3306"  # Default MySQL port
-    DB_USER = os.environ.get("MYSQL_USER")
-    DB_PASSWORD = os.environ.get("MYSQL_PASSWORD")
-    DB_NAME = os.environ.get("MYSQL_DATABASE")
+def update_vector_index(data_dir="vectordb/knowledge_base", index_dir="./vector_index", documents=None, progress=None):
+    """
+    Bring the vector index up to date with the exported files, or with documents when given.
+
+    Only documents whose content hash differs from the manifest are
+    re-embedded; deleted documents are removed from the index. Falls back to
+    a full build when there is no index or manifest yet.
+    """
+    manifest = load_manifest(index_dir)
+    if manifest is None:
+        print("No index manifest found, building the full index")
+        return build_vector_index(data_dir, index_dir, documents=documents, progress=progress)
+
+    if documents is None:
+        documents = records_to_documents(read_records(data_dir))
+
+    embed_model = get_embed_model()
+    storage_context = StorageContext.from_defaults(persist_dir=index_dir, vector_store=load_vector_store(index_dir))
+    index = load_index_from_storage(storage_context, embed_model=embed_model)
+
+    hashes, embedded = index_documents(index, documents, manifest, embed_model, progress=progress)
+    deleted = [doc_id for doc_id in manifest if doc_id not in hashes]
+    print(f"Index update: {embedded} new or changed, {len(deleted)} deleted, "
+          f"{len(hashes) - embedded} unchanged documents")
+
+    if not embedded and not deleted:
+        return index
+
+    for doc_id in deleted:
+        index.delete_ref_doc(doc_id, delete_from_docstore=True)
+
+    index.storage_context.persist(index_dir)
+    save_manifest(hashes, index_dir)
+    print(f"Vector index updated in {index_dir}")
 
-    connection_string = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-    print(f"Using connection string: {connection_string}")
-    engine = create_engine(connection_string)
+    return index
+
+
+def rebuild(db_connection, full_rebuild=False, progress=None, index_root=INDEX_DIR):
+    """
+    Export the database and build the next index version in a staging directory.
 
-    # Test connection
+    The export is streamed straight into the index, so rows are written,
+    embedded and inserted a batch at a time. The new version is only
+    promoted once it is completely written; running agents keep reading the
+    current version until then. progress, when given, is called with the
+    records exported so far, the documents embedded and the records expected
+    (the size of the current index). Returns a summary of the rebuild.
+    """
+    current_manifest = load_manifest(resolve_index_dir(index_root))
+    expected = len(current_manifest) if current_manifest else None
+
+    def report(seen, embedded):
+        if progress is not None:
+            progress(records_exported=seen, documents_embedded=embedded, records_expected=expected)
+
+    staging_dir = create_staging_dir(index_root, copy_current=not full_rebuild)
     try:
-        tables = pd.read_sql("SHOW TABLES", engine)
-        print("Database connection successful!")
-    except Exception as e:
-        print(f"Error connecting to database: {e}")
-        return
+        documents = records_to_documents(stream_export(db_connection))
 
-    # Export files
-    file_paths = export_db_to_files(engine)
+        # Re-embed only what changed unless asked otherwise
+        if full_rebuild:
+            build_vector_index(index_dir=staging_dir, documents=documents, progress=report)
+        else:
+            update_vector_index(index_dir=staging_dir, documents=documents, progress=report)
+
+        manifest = load_manifest(staging_dir)
+        if manifest == current_manifest and not full_rebuild:
+            discard_staging_dir(staging_dir)
+            print("Vector index is already up to date")
+            return {"version": current_version(index_root), "promoted": False, "documents": len(manifest)}
+
+        version = promote(staging_dir, index_root)
+        return {"version": version, "promoted": True, "documents": len(manifest)}
+    except BaseException:
+        discard_staging_dir(staging_dir)
+        raise
 
-    # Build vector index
-    build_vector_index()
 
+def main(full_rebuild=False):
+    print("Connecting to database...")
+    engine = get_engine()
+    if not check_connection(engine):
+        return
+    print("Database connection successful!")
+
+    rebuild(engine, full_rebuild)
     print("Vector database creation completed successfully!")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(full_rebuild="--full" in sys.argv)
\ No newline at end of file
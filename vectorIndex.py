@@ -0,0 +1,428 @@
+import json
+import os
+import re
+import threading
+import time
+from llama_index.core import StorageContext, load_index_from_storage
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.retrievers import VectorIndexRetriever
+from dotenv import load_dotenv
+from embeddingCache import with_cache
+from annVectorStore import load_vector_store
+from indexVersions import INDEX_DIR, resolve_index_dir
+from clientLookup import get_client_lookup, format_matches, normalize, tokenize, token_similarity, uncovered_tokens
+from metrics import get_metrics
+
+load_dotenv(dotenv_path=".env.local")
+
+EMBED_MODEL_NAME = "text-embedding-ada-002"
+
+# How often (in seconds) a query checks whether the index on disk has changed
+RELOAD_CHECK_SECONDS = float(os.environ.get("VECTOR_INDEX_RELOAD_CHECK_SECONDS", "30"))
+
+# "retrieve" returns the matching documents as they are, "synthesize" has an
+# LLM write an answer from them first
+QUERY_MODE = os.environ.get("QUERY_INFO_MODE", "retrieve")
+
+# Results scoring below this similarity are dropped in retrieve mode
+MIN_SCORE = float(os.environ.get("QUERY_INFO_MIN_SCORE", "0"))
+
+# Comma-separated document types searched by default (client, company, service, protocol)
+DOC_TYPES = [t.strip() for t in os.environ.get("QUERY_INFO_DOC_TYPES", "").split(",") if t.strip()]
+
+# Metadata fields reported with each retrieved document
+RESULT_FIELDS = ("client_id", "enterprise_id", "enterprise_name", "protocol_id", "service_id", "name")
+
+# Document type implied by the prefix of an exported file name
+FILE_TYPES = (
+    ("clients_enterprise_", "client"),
+    ("client_", "client"),
+    ("enterprise_", "company"),
+    ("services_enterprise_", "service"),
+    ("protocol_", "protocol"),
+)
+ALL_DOC_TYPES = list(dict.fromkeys(doc_type for _, doc_type in FILE_TYPES))
+
+
+def index_version(index_root=INDEX_DIR):
+    """
+    Return a signature of the current index, starting with the directory holding its files.
+
+    The signature changes whenever a new version is promoted or a file of
+    the current index is written, so it can be compared to detect a rebuilt
+    index. Returns None if there is no index on disk.
+    """
+    index_dir = resolve_index_dir(index_root)
+    if not os.path.isdir(index_dir):
+        return None
+
+    signature = []
+    for name in sorted(os.listdir(index_dir)):
+        path = os.path.join(index_dir, name)
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            signature.append((name, stat.st_mtime_ns, stat.st_size))
+
+    if not signature:
+        return None
+    return (index_dir, *signature)
+
+
+class _LoadedIndex:
+    """An index loaded from disk together with the query engines built on it"""
+
+    def __init__(self, version, index):
+        self.version = version
+        self.index = index
+        self.query_engines = {}
+        self.retrievers = {}
+        self._catalog = None
+
+    @property
+    def catalog(self):
+        if self._catalog is None:
+            self._catalog = MetadataCatalog(self.index)
+        return self._catalog
+
+
+class VectorIndexHolder:
+    """
+    Process-wide holder for the persisted vector index.
+
+    The index is loaded lazily on first use and then shared by every call and
+    session in the worker. When the files on disk change, the new index is
+    loaded and swapped in as a whole, so queries in flight keep using the
+    index they started with.
+    """
+
+    def __init__(self, index_dir=INDEX_DIR, check_interval=RELOAD_CHECK_SECONDS, embed_model=None):
+        self.index_dir = index_dir
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._loaded = None
+        self._last_check = 0.0
+        self._embed_model = embed_model
+
+    def _get_embed_model(self):
+        # Make sure we're using the same embedding model that created the index.
+        # Repeated caller queries are answered from the embedding cache.
+        if self._embed_model is None:
+            from llama_index.embeddings.openai import OpenAIEmbedding
+            self._embed_model = with_cache(OpenAIEmbedding(model_name=EMBED_MODEL_NAME))
+        return self._embed_model
+
+    def _load(self, version):
+        index_dir = version[0]
+        print(f"Loading vector index from {index_dir}")
+        storage_context = StorageContext.from_defaults(
+            persist_dir=index_dir,
+            vector_store=load_vector_store(index_dir),
+        )
+        index = load_index_from_storage(storage_context, embed_model=self._get_embed_model())
+        return _LoadedIndex(version, index)
+
+    def _refresh(self):
+        loaded = self._loaded
+        now = time.monotonic()
+        if loaded is not None and now - self._last_check < self.check_interval:
+            return loaded
+
+        with self._lock:
+            loaded = self._loaded
+            if loaded is not None and now - self._last_check < self.check_interval:
+                return loaded
+
+            version = index_version(self.index_dir)
+            self._last_check = time.monotonic()
+            if version is None:
+                self._loaded = None
+                return None
+            if loaded is not None and loaded.version == version:
+                return loaded
+
+            try:
+                self._loaded = self._load(version)
+            except Exception as e:
+                # The index may be in the middle of being written; keep serving
+                # the previous one and try again on the next check
+                print(f"Error loading vector index: {e}")
+                if loaded is None:
+                    raise
+
+            return self._loaded
+
+    def get_index(self):
+        """Return the current index, or None if no index has been built"""
+        loaded = self._refresh()
+        return loaded.index if loaded is not None else None
+
+    def get_query_engine(self, top_k, doc_types=None, enterprise=None):
+        """Return a query engine for the current index, reused across calls when unfiltered"""
+        loaded = self._refresh()
+        if loaded is None:
+            return None
+
+        node_ids = loaded.catalog.node_ids(doc_types, enterprise)
+        if node_ids is not None:
+            retriever = VectorIndexRetriever(loaded.index, similarity_top_k=top_k, node_ids=node_ids)
+            return RetrieverQueryEngine.from_args(retriever)
+
+        query_engine = loaded.query_engines.get(top_k)
+        if query_engine is None:
+            query_engine = loaded.index.as_query_engine(similarity_top_k=top_k)
+            loaded.query_engines[top_k] = query_engine
+        return query_engine
+
+    def get_retriever(self, top_k, doc_types=None, enterprise=None):
+        """
+        Return a retriever for the current index.
+
+        Unfiltered retrievers are reused across calls; with filters the
+        retriever only scores the nodes of matching type and enterprise.
+        """
+        loaded = self._refresh()
+        if loaded is None:
+            return None
+
+        node_ids = loaded.catalog.node_ids(doc_types, enterprise)
+        if node_ids is not None:
+            return VectorIndexRetriever(loaded.index, similarity_top_k=top_k, node_ids=node_ids)
+
+        retriever = loaded.retrievers.get(top_k)
+        if retriever is None:
+            retriever = loaded.index.as_retriever(similarity_top_k=top_k)
+            loaded.retrievers[top_k] = retriever
+        return retriever
+
+    def reload(self):
+        """Force the next query to check the index on disk"""
+        self._last_check = 0.0
+
+
+_holder = None
+_holder_lock = threading.Lock()
+
+
+def get_index_holder():
+    """Return the shared index holder for this process"""
+    global _holder
+    if _holder is None:
+        with _holder_lock:
+            if _holder is None:
+                _holder = VectorIndexHolder()
+    return _holder
+
+
+def document_metadata(file_name, text):
+    """
+    Return the type and identifiers of an exported document.
+
+    Documents exported as JSON carry their fields in the text itself;
+    protocols carry their id in a "protocol_id:" heading.
+    """
+    metadata = {}
+    for prefix, doc_type in FILE_TYPES:
+        if file_name.startswith(prefix):
+            metadata["type"] = doc_type
+            break
+
+    try:
+        doc = json.loads(text)
+    except ValueError:
+        doc = None
+
+    if isinstance(doc, dict):
+        for field in RESULT_FIELDS:
+            if doc.get(field) not in (None, ""):
+                metadata[field] = str(doc[field])
+        if doc.get("enterprises_names"):
+            metadata.setdefault("enterprise_name", str(doc["enterprises_names"]))
+        if doc.get("type"):
+            metadata.setdefault("type", str(doc["type"]).lower())
+        if metadata.get("type") == "company" and "name" in metadata:
+            metadata.setdefault("enterprise_name", metadata["name"])
+    else:
+        match = re.search(r"protocol_id:\s*(\S+)", text)
+        if match:
+            metadata["protocol_id"] = match.group(1)
+
+    return metadata
+
+
+def node_metadata(node):
+    """
+    Return the type and identifiers of a retrieved node.
+
+    Indexes built by vectorDbHandler.load_documents store them as node
+    metadata; older indexes only have the file name, so they are parsed
+    from the content.
+    """
+    if "type" not in node.metadata:
+        return document_metadata(node.metadata.get("file_name", ""), node.get_content())
+
+    return {
+        field: str(value) for field, value in node.metadata.items()
+        if field in RESULT_FIELDS or field == "type"
+    }
+
+
+def _enterprise_names(metadata):
+    return [normalize(name) for name in metadata.get("enterprise_name", "").split(",") if name.strip()]
+
+
+def enterprise_matches(enterprise, names):
+    """Whether the requested enterprise is one of the normalized names, tolerating misspelled words"""
+    tokens = tokenize(enterprise)
+    if not tokens:
+        return True
+    for name in names:
+        name_tokens = name.split()
+        if all(any(token_similarity(token, other) >= 0.8 for other in name_tokens) for token in tokens):
+            return True
+    return False
+
+
+class MetadataCatalog:
+    """
+    Node ids of an index grouped by document type and enterprise.
+
+    Used to restrict a similarity search to the matching nodes before any
+    similarity is computed.
+    """
+
+    def __init__(self, index):
+        self.by_type = {}
+        self.by_enterprise = {}
+        self.unscoped = set()
+
+        for node_id, node in index.docstore.docs.items():
+            metadata = node_metadata(node)
+            self.by_type.setdefault(metadata.get("type"), set()).add(node_id)
+
+            names = _enterprise_names(metadata)
+            if not names:
+                self.unscoped.add(node_id)
+            for name in names:
+                self.by_enterprise.setdefault(name, set()).add(node_id)
+
+    def node_ids(self, doc_types=None, enterprise=None):
+        """
+        Return the ids of the nodes matching the filters, or None if there are no filters.
+
+        Documents not tied to any enterprise, such as protocols, are kept when
+        filtering by enterprise.
+        """
+        if not doc_types and not enterprise:
+            return None
+
+        node_ids = None
+        if doc_types:
+            node_ids = set().union(*(self.by_type.get(doc_type, set()) for doc_type in doc_types))
+
+        if enterprise:
+            scoped = set(self.unscoped)
+            for name, ids in self.by_enterprise.items():
+                if enterprise_matches(enterprise, [name]):
+                    scoped.update(ids)
+            node_ids = scoped if node_ids is None else node_ids & scoped
+
+        return list(node_ids)
+
+
+def compact_text(text):
+    """Collapse indentation and blank lines so results stay short for the agent"""
+    try:
+        return json.dumps(json.loads(text), ensure_ascii=False, separators=(",", ":"))
+    except ValueError:
+        return "\n".join(line.strip() for line in text.splitlines() if line.strip())
+
+
+def format_results(results):
+    """Format retrieved nodes as one header line with score and metadata followed by the content"""
+    blocks = []
+    for result, metadata in results:
+        fields = " ".join(f"{field}={value}" for field, value in metadata.items())
+        blocks.append(f"[score={result.score or 0:.3f}] {fields}\n{compact_text(result.node.get_content())}")
+    return "\n\n".join(blocks)
+
+
+def retrieve(query, top_k=5, min_score=MIN_SCORE, doc_types=None, enterprise=None):
+    """
+    Return the top matching nodes with their metadata, without LLM synthesis.
+
+    Only nodes of the given document types and enterprise are searched.
+    Returns None if there is no index.
+    """
+    doc_types = [t.lower() for t in (doc_types or DOC_TYPES)]
+    metrics = get_metrics()
+    with metrics.timer("query_info_stage_seconds", stage="index_load"):
+        retriever = get_index_holder().get_retriever(top_k, doc_types=doc_types, enterprise=enterprise)
+    if retriever is None:
+        return None
+
+    # Includes embedding the query, which is also timed on its own
+    with metrics.timer("query_info_stage_seconds", stage="retrieval"):
+        retrieved = retriever.retrieve(query)
+
+    results = []
+    for result in retrieved:
+        if result.score is not None and result.score < min_score:
+            continue
+        results.append((result, node_metadata(result.node)))
+    return results
+
+
+def search_knowledge_base(query, top_k=5, mode=QUERY_MODE, min_score=MIN_SCORE, doc_types=None, enterprise=None):
+    """
+    Find clients, companies or protocols matching the query.
+
+    This does blocking file and network I/O; call it from a worker thread
+    when running inside the agent's event loop.
+    """
+    # Resolve client name + company from the structured export first,
+    # only falling back to vector search when no client matches
+    doc_types = [t.lower() for t in (doc_types or DOC_TYPES)]
+    found = ""
+    if not doc_types or "client" in doc_types:
+        lookup_query = f"{query} {enterprise}" if enterprise else query
+        with get_metrics().timer("query_info_stage_seconds", stage="client_lookup"):
+            matches = get_client_lookup().search(lookup_query, limit=top_k)
+        if matches:
+            found = format_matches(matches)
+            remaining = uncovered_tokens(query, matches)
+            other_types = [t for t in (doc_types or ALL_DOC_TYPES) if t != "client"]
+            if not remaining or not other_types:
+                return f"SEARCH RESULTS:\n{found}"
+            # The caller also said what they need; search the other
+            # documents for the words that aren't the client's name or company
+            query = " ".join(remaining)
+            doc_types = other_types
+
+    if mode == "retrieve":
+        # The agent's own LLM reads the documents directly, so no second
+        # LLM call is spent summarizing them
+        results = retrieve(query, top_k, min_score=min_score, doc_types=doc_types, enterprise=enterprise)
+        if found:
+            return f"SEARCH RESULTS:\n{found}\n\n{format_results(results)}" if results else f"SEARCH RESULTS:\n{found}"
+        if results is None:
+            return "ERROR: Vector index not found."
+        if not results:
+            return "SEARCH RESULTS:\nNo matching documents found."
+        return f"SEARCH RESULTS:\n{format_results(results)}"
+
+    # The index is loaded once per process and reused across calls
+    with get_metrics().timer("query_info_stage_seconds", stage="index_load"):
+        query_engine = get_index_holder().get_query_engine(top_k, doc_types=doc_types, enterprise=enterprise)
+    if query_engine is None:
+        return f"SEARCH RESULTS:\n{found}" if found else "ERROR: Vector index not found."
+
+    # Split name and company for better search
+    enhanced_query = f"""Find information about {query}. There are this posibilities, match with the client name, the enterprise name, 
+                        the service description or name if you find a match with the client name the enterprise name gave should match the one associated with the client provided must have."""
+
+    with get_metrics().timer("query_info_stage_seconds", stage="synthesis"):
+        response = query_engine.query(enhanced_query)
+
+    if found:
+        return f"SEARCH RESULTS:\n{found}\n\n{str(response)}"
+    return f"SEARCH RESULTS:\n{str(response)}"